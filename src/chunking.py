@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Shared chunk splitting for the LLM pipeline stages.
+
+One implementation serves preprocessing and translation (and any future
+stage): paragraph-first packing with a sentence-aware fallback for
+oversized paragraphs. Budgets are in tokens, matching what the API
+limits; English packs far more characters per chunk than CJK.
+"""
+
+import functools
+import re
+
+from config import TRANSLATION_MODEL
+
+# tiktoken encoding, resolved lazily on first use: the model's own
+# encoding when known, o200k_base for models tiktoken has not heard of,
+# False when no encoding can be loaded at all
+_ENCODING = None
+
+
+def _get_encoding():
+    global _ENCODING
+    if _ENCODING is None:
+        # Broad catch: beyond ImportError, tiktoken downloads the BPE
+        # vocabulary on first use, so offline runs raise network errors
+        # here. Either way the chars/4 estimate keeps the pipeline going.
+        try:
+            import tiktoken
+            try:
+                _ENCODING = tiktoken.encoding_for_model(TRANSLATION_MODEL)
+            except KeyError:
+                _ENCODING = tiktoken.get_encoding('o200k_base')
+        except Exception as e:
+            print(f"chunking: tiktoken unavailable ({e}); "
+                  "estimating tokens as chars/4")
+            _ENCODING = False
+    return _ENCODING or None
+
+
+@functools.lru_cache(maxsize=4096)
+def token_len(text: str) -> int:
+    """Token count of text; memoized since the splitter re-measures the
+    same paragraphs and sentences across packing passes.
+
+    Falls back to a chars/4 estimate when tiktoken is unavailable.
+    """
+    enc = _get_encoding()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text))
+
+
+# One sentence: anything up to an ender (English .!? or Chinese 。！？)
+# whose trailing closing quotes/brackets are followed by whitespace or
+# end of text. Enders not at such a position (decimals, abbreviations,
+# CJK enders mid-line) are consumed as ordinary characters, matching the
+# cut rule of the old character-by-character scanner.
+_SENTENCE_RE = re.compile(
+    r'(?:[^.!?。！？]|[.!?。！？](?!["\'\)\]”’』」»）]*(?:\s|$)))*'
+    r'[.!?。！？]+["\'\)\]”’』」»）]*(?=\s|$)'
+)
+
+
+def _split_sentences(text: str) -> list:
+    """Split a paragraph into sentences using simple punctuation heuristics.
+
+    Handles both English (.!?), and Chinese (。！？) sentence enders and consumes
+    following closing quotes/brackets. Keeps original order without rephrasing.
+    """
+    sentences = []
+    pos = 0
+    for match in _SENTENCE_RE.finditer(text):
+        seg = match.group().strip()
+        if seg:
+            sentences.append(seg)
+        pos = match.end()
+    # trailing remainder (text after the last complete sentence)
+    rem = text[pos:].strip()
+    if rem:
+        sentences.append(rem)
+    return sentences
+
+
+def split_into_chunks(text: str, max_tokens: int) -> list:
+    """Split text into chunks with paragraph-first and sentence-aware boundaries.
+
+    - Greedily packs paragraphs (split by blank lines) up to max_tokens.
+    - If a single paragraph exceeds max_tokens, split it into sentences and pack.
+    - Falls back to space boundaries if a very long sentence exceeds max_tokens.
+    """
+    paragraphs = text.split('\n\n')
+    chunks = []
+
+    current = []
+    current_len = 0
+
+    def flush_current():
+        nonlocal current, current_len
+        if current:
+            chunks.append('\n\n'.join(current).strip())
+            current = []
+            current_len = 0
+
+    for para in paragraphs:
+        # joining separators cost roughly one token
+        sep = 1 if current else 0
+
+        if not para:
+            # preserve multiple blank blocks sparingly
+            if current_len + sep <= max_tokens:
+                current.append('')
+                current_len += sep
+            else:
+                flush_current()
+            continue
+
+        # if this paragraph fits, add it
+        if current_len + sep + token_len(para) <= max_tokens:
+            current.append(para)
+            current_len += sep + token_len(para)
+            continue
+
+        # if current has content, flush it first to keep boundaries clean
+        if current:
+            flush_current()
+
+        # paragraph is too large: split by sentences and pack
+        sentences = _split_sentences(para)
+        buf = []
+        buf_len = 0
+        for sent in sentences:
+            sep_in = 1 if buf else 0
+            if buf_len + sep_in + token_len(sent) <= max_tokens:
+                buf.append(sent)
+                buf_len += sep_in + token_len(sent)
+            else:
+                if buf:
+                    chunks.append(' '.join(buf).strip())
+                    buf = [sent]
+                    buf_len = token_len(sent)
+                else:
+                    # ultra-long sentence: hard cut at last space before a
+                    # max_tokens-char window (a token is at least one
+                    # character, so the window can never exceed the budget)
+                    s = sent
+                    i = 0
+                    while i < len(s):
+                        end = min(i + max_tokens, len(s))
+                        part = s[i:end]
+                        if end < len(s):
+                            cut = part.rfind(' ')
+                            if cut > max_tokens * 0.6:
+                                part = part[:cut]
+                                end = i + cut
+                        chunks.append(part.strip())
+                        i = end
+                    buf = []
+                    buf_len = 0
+        if buf:
+            chunks.append(' '.join(buf).strip())
+
+    flush_current()
+    return [c for c in chunks if c]
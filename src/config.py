@@ -24,17 +24,80 @@ SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-5')
 TTS_MODEL = os.getenv('TTS_MODEL', 'tts-1-hd')
 TTS_VOICE = os.getenv('TTS_VOICE', 'nova')
 TTS_QPM = int(os.getenv('TTS_QPM', 5))
+# Output container ('mp3', 'opus' or 'aac'; opus is smaller and faster
+# to generate) and playback speed for the speech endpoint. Only formats
+# whose parts survive byte concatenation are supported, since chapter
+# audio is merged that way (wav/flac would yield broken merged files);
+# the MIME type keeps the website player honest about the actual bytes.
+_TTS_FORMAT_MIME = {
+    'mp3': 'audio/mpeg',
+    'opus': 'audio/ogg',
+    'aac': 'audio/aac',
+}
+TTS_OUTPUT_FORMAT = os.getenv('TTS_OUTPUT_FORMAT', 'mp3')
+if TTS_OUTPUT_FORMAT not in _TTS_FORMAT_MIME:
+    raise ValueError(
+        f"Unsupported TTS_OUTPUT_FORMAT {TTS_OUTPUT_FORMAT!r}; "
+        f"choose from {sorted(_TTS_FORMAT_MIME)}")
+TTS_AUDIO_MIME = _TTS_FORMAT_MIME[TTS_OUTPUT_FORMAT]
+TTS_SPEED = float(os.getenv('TTS_SPEED', 1.0))
 
 # Processing Settings
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.7))
+# Chat-completion requests allowed in flight at once per pipeline stage
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 4))
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
-CHUNK_SIZE = 3000  # Characters per translation chunk
-# Preprocessing chunk size (characters). Use larger chunks, split on blank lines
-# Can be overridden via env PREPROCESS_CHUNK_SIZE
-PREPROCESS_CHUNK_SIZE = int(os.getenv('PREPROCESS_CHUNK_SIZE', 8000))
+# Chunk budgets are in tokens, since that is what the API actually
+# limits; chars-per-token varies wildly between English body text and
+# CJK, so character budgets either overflow or waste headroom
+MAX_INPUT_TOKENS = int(os.getenv('MAX_INPUT_TOKENS', 2000))  # per translation chunk
+# Preprocessing uses larger chunks, split on blank lines
+PREPROCESS_MAX_INPUT_TOKENS = int(os.getenv('PREPROCESS_MAX_INPUT_TOKENS', 4000))
 MAX_AUDIO_CHUNK = 4000  # Characters per TTS chunk
 
 
+def _make_http_client(use_async: bool):
+    """Build the transport shared by the OpenAI clients.
+
+    HTTP/2 multiplexes concurrent requests over one connection, and the
+    explicit pool limits comfortably cover the concurrent stages instead
+    of the SDK's defaults. Falls back to HTTP/1.1 when the optional h2
+    package is missing.
+    """
+    import httpx
+
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    client_cls = httpx.AsyncClient if use_async else httpx.Client
+    try:
+        return client_cls(http2=True, limits=limits)
+    except ImportError:
+        return client_cls(limits=limits)
+
+
+def llm_retry():
+    """Retry decorator for chat-completion calls.
+
+    Jittered exponential backoff on transient failures only — rate
+    limits, connection drops, timeouts. Non-transient errors (bad
+    request, auth) propagate immediately instead of burning MAX_RETRIES
+    attempts on a call that can never succeed.
+    """
+    import openai
+    from tenacity import (retry, retry_if_exception_type, stop_after_attempt,
+                          wait_exponential_jitter)
+
+    return retry(
+        retry=retry_if_exception_type((
+            openai.RateLimitError,
+            openai.APIConnectionError,
+            openai.APITimeoutError,
+        )),
+        wait=wait_exponential_jitter(initial=1, max=60),
+        stop=stop_after_attempt(MAX_RETRIES),
+        reraise=True,
+    )
+
+
 def get_openai_client(api_key: str = None):
     """
     Create OpenAI client with proper configuration.
@@ -53,14 +116,47 @@ def get_openai_client(api_key: str = None):
             api_key=key,
             api_version=OPENAI_API_VERSION or 'preview',
             timeout=1200,
-            max_retries=MAX_RETRIES
+            max_retries=MAX_RETRIES,
+            http_client=_make_http_client(use_async=False)
         )
     else:
         return OpenAI(
             base_url=OPENAI_API_BASE,
             api_key=key,
             timeout=1200,
-            max_retries=MAX_RETRIES
+            max_retries=MAX_RETRIES,
+            http_client=_make_http_client(use_async=False)
+        )
+
+
+def get_async_openai_client(api_key: str = None):
+    """
+    Async variant of get_openai_client for concurrent request dispatch.
+    Supports both standard OpenAI and Azure OpenAI endpoints.
+    """
+    from openai import AsyncOpenAI, AsyncAzureOpenAI
+
+    key = api_key or OPENAI_API_KEY
+    if not key:
+        raise ValueError("No API key found. Set OPENAI_API_KEY in .env")
+
+    # Check if using Azure endpoint
+    if 'azure' in OPENAI_API_BASE.lower() or OPENAI_API_VERSION:
+        return AsyncAzureOpenAI(
+            azure_endpoint=OPENAI_API_BASE,
+            api_key=key,
+            api_version=OPENAI_API_VERSION or 'preview',
+            timeout=1200,
+            max_retries=MAX_RETRIES,
+            http_client=_make_http_client(use_async=True)
+        )
+    else:
+        return AsyncOpenAI(
+            base_url=OPENAI_API_BASE,
+            api_key=key,
+            timeout=1200,
+            max_retries=MAX_RETRIES,
+            http_client=_make_http_client(use_async=True)
         )
 
 
@@ -89,5 +185,9 @@ def get_docs_paths(book_slug: str):
 
 def ensure_dirs(paths: dict):
     """Create all directories if they don't exist"""
+    # utils.ensure_dir memoizes created paths, so repeated calls when
+    # many books are processed in one run stay a set lookup
+    from utils import ensure_dir
+
     for path in paths.values():
-        path.mkdir(parents=True, exist_ok=True)
+        ensure_dir(path)
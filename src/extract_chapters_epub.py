@@ -6,66 +6,70 @@ making extraction simpler than PDFs.
 """
 
 import re
+from collections import deque
 from pathlib import Path
 from ebooklib import epub
 import ebooklib
 
 # Support both direct execution and module import
 try:
-    from .utils import clean_html_text, chinese_to_int
+    from .utils import clean_html_text, chinese_to_int, ensure_dir
 except ImportError:
-    from utils import clean_html_text, chinese_to_int
+    from utils import clean_html_text, chinese_to_int, ensure_dir
 
 
-def extract_toc_chapters_epub(epub_path: str) -> list:
+# Compiled once; matched against every TOC entry / document in the book.
+# The title pattern runs on raw bytes so whole documents are never decoded
+# just to pull out a heading.
+_PART_RE = re.compile(r'^part\s*[ivxlcdm0-9]*$')
+_TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title>|<h1[^>]*>(.*?)</h1>',
+                       re.IGNORECASE | re.DOTALL)
+
+
+def extract_toc_chapters_epub(book) -> list:
     """
     Extract chapter information from EPUB's built-in TOC.
 
+    Args:
+        book: Parsed epub.EpubBook
+
     Returns:
         List of tuples: (chapter_number, title, item_id)
     """
-    book = epub.read_epub(epub_path)
     toc = book.toc
 
     if not toc:
         return []
 
     chapters = []
-    chapter_num = 0
     seen_hrefs = set()  # Track seen hrefs to avoid duplicates
+    lines = []  # Buffered progress output, printed once at the end
 
-    # Keywords that indicate section/part headers (not actual chapters)
-    section_keywords = ['part', 'section', 'introduction to part', 'unit']
-
-    def is_section_header(title: str) -> bool:
-        """Check if this is a section/part header rather than a chapter"""
-        title_lower = title.lower().strip()
-        # Check if it's ONLY "part" or "part I/II/III" etc.
-        if re.match(r'^part\s*[ivxlcdm0-9]*$', title_lower):
-            return True
-        return False
-
-    def is_valid_chapter(title: str, href: str) -> bool:
-        """Check if this is a valid chapter to extract"""
+    def add_if_valid(title: str, href: str):
+        """Append a chapter unless it is a section header or duplicate"""
         title_lower = title.lower().strip()
 
-        # Skip section headers
-        if is_section_header(title):
-            return False
-
-        # Skip generic "chapter" entries (likely duplicates or navigation links)
-        if title_lower == 'chapter':
-            return False
+        # Skip "part I/II/III"-style section headers and generic
+        # "chapter" entries (likely duplicates or navigation links)
+        if _PART_RE.match(title_lower) or title_lower == 'chapter':
+            return
 
         # Skip if we've already seen this href (duplicate entry)
         if href in seen_hrefs:
-            return False
+            return
+
+        chapter_num = len(chapters) + 1
+        chapters.append((chapter_num, title, href))
+        seen_hrefs.add(href)
+        lines.append(f"  Chapter {chapter_num}: '{title}'")
 
-        return True
+    print(f"Found EPUB TOC with {len(toc)} entries")
 
-    def parse_toc_item(item, depth=0):
-        """Recursively parse TOC items (handles nested sections)"""
-        nonlocal chapter_num
+    # Iterative walk of the (possibly deeply nested) TOC tree; children
+    # are pushed to the front so document order is preserved
+    stack = deque(toc)
+    while stack:
+        item = stack.popleft()
 
         if isinstance(item, tuple):
             # Nested section: (Section/Link, children)
@@ -73,55 +77,42 @@ def extract_toc_chapters_epub(epub_path: str) -> list:
             children = item[1] if len(item) > 1 else []
 
             # If the section itself is a Link (not just a Section header), extract it
-            if isinstance(section, epub.Link) and is_valid_chapter(section.title, section.href):
-                chapter_num += 1
-                chapters.append((chapter_num, section.title, section.href))
-                seen_hrefs.add(section.href)
-                print(f"  Chapter {chapter_num}: '{section.title}'")
+            if isinstance(section, epub.Link):
+                add_if_valid(section.title, section.href)
 
-            # Process children (actual chapters in the section)
-            for sub_item in children:
-                parse_toc_item(sub_item, depth + 1)
+            stack.extendleft(reversed(children))
 
         elif isinstance(item, epub.Link):
             # Direct link - extract if valid
-            if is_valid_chapter(item.title, item.href):
-                chapter_num += 1
-                chapters.append((chapter_num, item.title, item.href))
-                seen_hrefs.add(item.href)
-                print(f"  Chapter {chapter_num}: '{item.title}'")
+            add_if_valid(item.title, item.href)
 
         elif isinstance(item, epub.Section):
             # Section header alone - skip it (just a label)
             pass
 
-        else:
+        elif hasattr(item, 'get_name'):
             # Assume it's an EpubHtml item
-            if hasattr(item, 'get_name'):
-                href = item.get_name()
-                title = getattr(item, 'title', f'Chapter {chapter_num + 1}')
-                if is_valid_chapter(title, href):
-                    chapter_num += 1
-                    chapters.append((chapter_num, title, href))
-                    seen_hrefs.add(href)
-                    print(f"  Chapter {chapter_num}: '{title}'")
+            href = item.get_name()
+            title = getattr(item, 'title', f'Chapter {len(chapters) + 1}')
+            add_if_valid(title, href)
 
-    print(f"Found EPUB TOC with {len(toc)} entries")
-    for item in toc:
-        parse_toc_item(item)
+    if lines:
+        print('\n'.join(lines))
 
     return chapters
 
 
-def extract_all_documents_epub(epub_path: str) -> list:
+def extract_all_documents_epub(book) -> list:
     """
     Fallback: Extract all ITEM_DOCUMENT items as chapters.
     Used when TOC is not available or unreliable.
 
+    Args:
+        book: Parsed epub.EpubBook
+
     Returns:
         List of tuples: (chapter_number, title, item_name)
     """
-    book = epub.read_epub(epub_path)
     chapters = []
     chapter_num = 0
 
@@ -133,14 +124,14 @@ def extract_all_documents_epub(epub_path: str) -> list:
 
             # Try to extract title from HTML
             try:
-                html_content = item.get_content().decode('utf-8')
-                # Look for <title> or <h1> tags
-                title_match = re.search(r'<title>(.*?)</title>', html_content, re.IGNORECASE)
-                if not title_match:
-                    title_match = re.search(r'<h1[^>]*>(.*?)</h1>', html_content, re.IGNORECASE)
+                # Titles live near the top of the document: search the
+                # first 4 KB and only fall back to the full content
+                raw = item.get_content()
+                title_match = _TITLE_RE.search(raw[:4096]) or _TITLE_RE.search(raw)
 
                 if title_match:
-                    title = clean_html_text(title_match.group(1))
+                    raw_title = title_match.group(1) or title_match.group(2) or b''
+                    title = clean_html_text(raw_title.decode('utf-8', errors='replace'))
                 else:
                     title = f"Chapter {chapter_num}"
             except:
@@ -152,15 +143,18 @@ def extract_all_documents_epub(epub_path: str) -> list:
     return chapters
 
 
-def find_chapter_items(epub_path: str) -> list:
+def find_chapter_items(book) -> list:
     """
     Find chapters using the best available method.
 
+    Args:
+        book: Parsed epub.EpubBook
+
     Returns:
         List of tuples: (chapter_number, title, item_identifier)
     """
     # Try TOC first (most reliable)
-    chapters = extract_toc_chapters_epub(epub_path)
+    chapters = extract_toc_chapters_epub(book)
 
     if chapters:
         print(f"\nUsing EPUB TOC (found {len(chapters)} chapters)")
@@ -168,7 +162,7 @@ def find_chapter_items(epub_path: str) -> list:
 
     # Fallback to extracting all documents
     print("\nNo reliable TOC found, extracting all document items...")
-    chapters = extract_all_documents_epub(epub_path)
+    chapters = extract_all_documents_epub(book)
 
     if chapters:
         print(f"Found {len(chapters)} chapters from document items")
@@ -191,56 +185,57 @@ def extract_chapters_epub(epub_path: str, output_dir: str, skip_pages: int = 0)
         List of chapter metadata dictionaries
     """
     output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+    ensure_dir(output_dir)
+
+    # Parse the EPUB once (each read_epub call unzips and XML-parses
+    # the whole book) and share it between detection and extraction
+    book = epub.read_epub(epub_path)
 
     # Get chapters as list of (chapter_num, title, item_id)
-    chapters = find_chapter_items(epub_path)
+    chapters = find_chapter_items(book)
 
     if not chapters:
         print("Error: No chapters found!")
         return []
 
-    book = epub.read_epub(epub_path)
     chapters_meta = []
 
-    # Create a mapping of item names to items for quick lookup
+    # Map item names to items in one pass; index by both the raw name and
+    # its anchor-stripped form so lookups below are a single dict access
     items_map = {}
     for item in book.get_items():
         if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            items_map[item.get_name()] = item
+            name = item.get_name()
+            items_map[name] = item
+            items_map.setdefault(name.split('#', 1)[0], item)
 
     for chapter_num, title, item_id in chapters:
-        # Find the item by ID/href
-        item = None
-
-        # Try exact match first
-        if item_id in items_map:
-            item = items_map[item_id]
-        else:
-            # Try to find by matching href (might have anchor)
-            item_id_base = item_id.split('#')[0]
-            if item_id_base in items_map:
-                item = items_map[item_id_base]
+        # Find the item by ID/href (TOC hrefs may carry an anchor)
+        item = items_map.get(item_id) or items_map.get(item_id.split('#', 1)[0])
 
         if not item:
             print(f"  Warning: Could not find item for Chapter {chapter_num}: '{title}'")
             continue
 
         try:
-            # Extract and clean HTML content
-            html_content = item.get_content().decode('utf-8')
-            text = clean_html_text(html_content)
+            # Extract and clean HTML content; skip the decode for
+            # navigation stubs and other empty items
+            raw = item.get_content()
+            if not raw.strip():
+                print(f"  Skipping Chapter {chapter_num}: '{title}' (empty)")
+                continue
+            text = clean_html_text(raw.decode('utf-8', errors='replace'))
 
             # Skip empty chapters
             if not text.strip():
                 print(f"  Skipping Chapter {chapter_num}: '{title}' (empty)")
                 continue
 
-            # Save chapter
+            # Save chapter: pre-encode once and write the bytes directly,
+            # skipping the text layer's incremental encoder
             chapter_file = output_dir / f"chapter_{chapter_num:02d}.txt"
-            with open(chapter_file, 'w', encoding='utf-8') as f:
-                f.write(f"{chapter_num}. {title}\n\n")
-                f.write(text)
+            payload = f"{chapter_num}. {title}\n\n{text}".encode('utf-8')
+            chapter_file.write_bytes(payload)
 
             meta = {
                 'number': chapter_num,
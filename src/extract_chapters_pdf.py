@@ -5,118 +5,217 @@ Extract chapters from PDF using multiple detection strategies:
 2. Text pattern matching (fallback)
 """
 
+import io
+import os
 import re
-import fitz  # PyMuPDF - better for TOC extraction
-import pdfplumber
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF - C-backed text extraction, much faster than pdfminer
 
 # Support both direct execution and module import
 try:
-    from .utils import chinese_to_int, extract_title_from_lines
+    from .utils import chinese_to_int, ensure_dir, extract_title_from_lines
 except ImportError:
-    from utils import chinese_to_int, extract_title_from_lines
+    from utils import chinese_to_int, ensure_dir, extract_title_from_lines
+
+
+# Chapter-heading patterns, compiled once (the scan pass matches them
+# against up to 5 lines on every page)
+_CHAPTER_PATTERNS = [
+    # "Chapter 1" or "CHAPTER 1"
+    (re.compile(r'^(?:chapter|CHAPTER)\s+(\d+)', re.IGNORECASE),
+     lambda m: int(m.group(1))),
+    # "第1章" or "第一章"
+    (re.compile(r'^第([一二三四五六七八九十百\d]+)章'),
+     lambda m: chinese_to_int(m.group(1))),
+    # Standalone number at start (1-99), more strict matching
+    (re.compile(r'^(\d{1,2})\s*$'),
+     lambda m: int(m.group(1))),
+]
 
 
-def extract_toc_chapters(pdf_path: str) -> list:
+def extract_toc_chapters(doc) -> list:
     """
     Extract chapter information from PDF's built-in TOC/outline.
 
+    Args:
+        doc: Open fitz.Document
+
     Returns:
         List of tuples: (chapter_number, title, page_index)
     """
-    chapters = []
+    toc = doc.get_toc()  # Returns list of [level, title, page]
 
-    with fitz.open(pdf_path) as doc:
-        toc = doc.get_toc()  # Returns list of [level, title, page]
+    if not toc:
+        return []
 
-        if not toc:
-            return []
+    print(f"Found PDF outline with {len(toc)} entries")
 
-        print(f"Found PDF outline with {len(toc)} entries")
+    # Only use top-level entries (level 1) as chapters; TOC pages are
+    # 1-indexed, convert to 0-indexed
+    chapters = [
+        (num, title.strip(), page - 1 if page > 0 else 0)
+        for num, (level, title, page) in enumerate(
+            (entry for entry in toc if entry[0] == 1), 1)
+    ]
 
-        chapter_num = 0
-        for level, title, page in toc:
-            # Only use top-level entries (level 1) as chapters
-            if level == 1:
-                chapter_num += 1
-                # page in TOC is 1-indexed, convert to 0-indexed
-                page_idx = page - 1 if page > 0 else 0
-                chapters.append((chapter_num, title.strip(), page_idx))
-                print(f"  Chapter {chapter_num}: '{title.strip()}' (page {page})")
+    if chapters:
+        # One buffered write instead of a stdout flush per entry
+        print('\n'.join(f"  Chapter {num}: '{title}' (page {page_idx + 1})"
+                        for num, title, page_idx in chapters))
 
     return chapters
 
 
-def find_chapter_pages_by_pattern(pdf_path: str, skip_pages: int = 10) -> list:
+# Per-worker PDF handle for the process pool (opened once per worker)
+_WORKER_DOC = None
+
+
+def _init_worker(pdf_path: str):
+    """Open the PDF once in each worker process."""
+    global _WORKER_DOC
+    _WORKER_DOC = fitz.open(pdf_path)
+
+
+def _is_image_only(doc, page_num: int) -> bool:
+    """True when a page is a scanned image with no text layer.
+
+    Checked via the page's resource dicts (no fonts but at least one
+    image), which is far cheaper than decompressing the content streams
+    only to get empty text back.
+    """
+    return (not doc.get_page_fonts(page_num)
+            and bool(doc.get_page_images(page_num)))
+
+
+def _extract_page_text(page_num: int) -> tuple:
+    """Worker target: extract text for a single page."""
+    if _is_image_only(_WORKER_DOC, page_num):
+        return page_num, ''
+    return page_num, _WORKER_DOC[page_num].get_text("text") or ''
+
+
+def _get_max_workers() -> int:
+    """Bound the process pool by available cores."""
+    return max(1, min(os.cpu_count() or 1, 8))
+
+
+def _fill_page_texts_parallel(pdf_path: str, page_texts: list, page_nums: list):
+    """Extract many pages in parallel, filling the shared text cache.
+
+    Page parsing is CPU-bound and independent per page, so it scales
+    near-linearly with cores on large books.
+    """
+    with ProcessPoolExecutor(max_workers=_get_max_workers(),
+                             initializer=_init_worker,
+                             initargs=(pdf_path,)) as executor:
+        for page_num, text in executor.map(_extract_page_text, page_nums, chunksize=10):
+            page_texts[page_num] = text
+
+
+def _page_text(doc, page_texts: list, page_num: int) -> str:
+    """Extract text for a page, paying the extraction cost at most once.
+
+    Results are memoized in page_texts so the pattern-scan pass and the
+    chapter-extraction pass never extract the same page twice.
+    """
+    text = page_texts[page_num]
+    if text is None:
+        if _is_image_only(doc, page_num):
+            text = ''
+        else:
+            text = doc[page_num].get_text("text") or ''
+        page_texts[page_num] = text
+    return text
+
+
+def find_chapter_pages_by_pattern(doc, skip_pages: int = 10, page_texts: list = None) -> list:
     """
     Fallback: Find chapters by text pattern matching.
     Supports multiple formats: standalone numbers, "Chapter N", "第N章", etc.
 
+    Args:
+        doc: Open fitz.Document
+        skip_pages: Number of front matter pages to skip
+        page_texts: Optional shared per-page text cache
+
     Returns:
         List of tuples: (chapter_number, title, page_index)
     """
     chapters = []
     seen_chapters = set()
+    last_found_page = None
 
-    # Patterns to match chapter headings
-    patterns = [
-        # "Chapter 1" or "CHAPTER 1"
-        (r'^(?:chapter|CHAPTER)\s+(\d+)', lambda m: int(m.group(1))),
-        # "第1章" or "第一章"
-        (r'^第([一二三四五六七八九十百\d]+)章', lambda m: chinese_to_int(m.group(1))),
-        # Standalone number at start (1-99), more strict matching
-        (r'^(\d{1,2})\s*$', lambda m: int(m.group(1))),
-    ]
+    # Stop scanning once this many pages pass without a new chapter;
+    # endmatter (notes, index) never yields markers but costs extraction
+    max_gap = 200
 
-    with pdfplumber.open(pdf_path) as pdf:
-        print(f"Scanning {len(pdf.pages)} pages for chapter markers...")
+    page_count = doc.page_count  # O(1), no page-tree walk
 
-        for page_num in range(skip_pages, len(pdf.pages)):
-            page = pdf.pages[page_num]
-            text = page.extract_text()
-            if not text:
-                continue
+    if page_texts is None:
+        page_texts = [None] * page_count
+
+    print(f"Scanning {page_count} pages for chapter markers...")
 
-            lines = text.split('\n')
-
-            # Check first 5 non-empty lines for chapter markers
-            checked = 0
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                checked += 1
-                if checked > 5:
-                    break
-
-                for pattern, extractor in patterns:
-                    match = re.match(pattern, line, re.IGNORECASE)
-                    if match:
-                        chapter_num = extractor(match)
-                        if 1 <= chapter_num <= 200 and chapter_num not in seen_chapters:
-                            # Extract title from subsequent lines
-                            title = extract_title_from_lines(lines, line)
-                            chapters.append((chapter_num, title, page_num))
-                            seen_chapters.add(chapter_num)
-                            print(f"  Found Chapter {chapter_num}: '{title}' (page {page_num + 1})")
-                            break
-                else:
-                    continue
+    for page_num in range(skip_pages, page_count):
+        if last_found_page is not None and page_num - last_found_page > max_gap:
+            print(f"  No new chapters for {max_gap} pages, stopping scan at page {page_num + 1}")
+            break
+
+        text = _page_text(doc, page_texts, page_num)
+        if not text:
+            continue
+
+        # Markers sit at the top of the page: bound the split to the head
+        # of the text instead of splitting the whole page into lines
+        lines = text[:512].split('\n', 6)[:6]
+
+        # Check first 5 non-empty lines for chapter markers
+        checked = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            checked += 1
+            if checked > 5:
                 break
 
+            for pattern, extractor in _CHAPTER_PATTERNS:
+                match = pattern.match(line)
+                if match:
+                    chapter_num = extractor(match)
+                    if 1 <= chapter_num <= 200 and chapter_num not in seen_chapters:
+                        # Extract title from subsequent lines (titles
+                        # follow the marker, so a bounded head suffices)
+                        title = extract_title_from_lines(text[:2048].split('\n'), line)
+                        chapters.append((chapter_num, title, page_num))
+                        seen_chapters.add(chapter_num)
+                        last_found_page = page_num
+                        print(f"  Found Chapter {chapter_num}: '{title}' (page {page_num + 1})")
+                        break
+            else:
+                continue
+            break
+
     # Sort by chapter number
     chapters.sort(key=lambda x: x[0])
     return chapters
 
 
-def find_chapter_pages(pdf_path: str, skip_pages: int = 10) -> list:
+def find_chapter_pages(doc, skip_pages: int = 10, page_texts: list = None) -> list:
     """
     Find chapters using the best available method.
 
+    Args:
+        doc: Open fitz.Document
+        skip_pages: Number of front matter pages to skip
+        page_texts: Optional shared per-page text cache
+
     Returns:
         List of tuples: (chapter_number, title, page_index)
     """
     # Try TOC first (most reliable)
-    chapters = extract_toc_chapters(pdf_path)
+    chapters = extract_toc_chapters(doc)
 
     if chapters:
         print(f"\nUsing PDF outline (found {len(chapters)} chapters)")
@@ -124,7 +223,7 @@ def find_chapter_pages(pdf_path: str, skip_pages: int = 10) -> list:
 
     # Fallback to pattern matching
     print("\nNo PDF outline found, using text pattern matching...")
-    chapters = find_chapter_pages_by_pattern(pdf_path, skip_pages)
+    chapters = find_chapter_pages_by_pattern(doc, skip_pages, page_texts)
 
     if chapters:
         print(f"Found {len(chapters)} chapters via pattern matching")
@@ -134,72 +233,121 @@ def find_chapter_pages(pdf_path: str, skip_pages: int = 10) -> list:
     return chapters
 
 
-def extract_chapters_pdf(pdf_path: str, output_dir: str, skip_pages: int = 10) -> list:
+def _save_chapters(pdf_path: str, doc, chapters: list, output_dir, page_texts: list) -> list:
+    """Stitch detected chapters into text files and return their metadata.
+
+    Shared by both extraction paths; pages still missing from page_texts
+    are pre-extracted in parallel before stitching.
     """
-    Extract chapters from PDF and save as text files.
+    total_pages = doc.page_count
+    chapters_meta = []
 
-    Args:
-        pdf_path: Path to PDF file
-        output_dir: Directory to save chapter files
-        skip_pages: Number of pages to skip
+    # Pre-extract every page the chapters will need, in parallel
+    first_page = chapters[0][2]
+    needed = [p for p in range(first_page, total_pages) if page_texts[p] is None]
+    if len(needed) > 1:
+        print(f"Extracting text from {len(needed)} pages "
+              f"({_get_max_workers()} workers)...")
+        _fill_page_texts_parallel(pdf_path, page_texts, needed)
+
+    for i, (chapter_num, title, start_page) in enumerate(chapters):
+        # Determine end page
+        if i + 1 < len(chapters):
+            end_page = chapters[i + 1][2]  # page_index of next chapter
+        else:
+            end_page = total_pages
+
+        # Stream page texts into one buffer instead of accumulating a
+        # list and paying for a second full-size join allocation
+        buf = io.StringIO()
+        for page_num in range(start_page, end_page):
+            if page_num < total_pages:
+                text = _page_text(doc, page_texts, page_num)
+                if text:
+                    if buf.tell():
+                        buf.write("\n\n")
+                    buf.write(text)
+
+        combined_text = buf.getvalue()
+
+        # Skip empty chapters
+        if not combined_text.strip():
+            print(f"  Skipping Chapter {chapter_num}: '{title}' (empty)")
+            continue
+
+        # Save chapter: pre-encode once and write the bytes directly,
+        # skipping the text layer's incremental encoder
+        chapter_file = output_dir / f"chapter_{chapter_num:02d}.txt"
+        payload = f"{chapter_num}. {title}\n\n{combined_text}".encode('utf-8')
+        chapter_file.write_bytes(payload)
+
+        meta = {
+            'number': chapter_num,
+            'title': title,
+            'pages': end_page - start_page,
+            'chars': len(combined_text),
+            'file': chapter_file.name
+        }
+        chapters_meta.append(meta)
+
+        print(f"  Chapter {chapter_num}: '{title}' - {len(combined_text):,} chars ({end_page - start_page} pages)")
 
-    Returns:
-        List of chapter metadata dictionaries
+    return chapters_meta
+
+
+def _extract_via_toc(pdf_path: str, doc, output_dir) -> list:
+    """Fast path for the common case: the outline alone defines chapters.
+
+    Skips the pattern machinery entirely; every page goes straight to
+    the parallel extractor. Returns None when the PDF has no outline.
     """
-    from pathlib import Path
+    chapters = extract_toc_chapters(doc)
+    if not chapters:
+        return None
+
+    print(f"\nUsing PDF outline (found {len(chapters)} chapters)")
+    page_texts = [None] * doc.page_count
+    return _save_chapters(pdf_path, doc, chapters, output_dir, page_texts)
 
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Get chapters as list of (chapter_num, title, page_index)
-    chapters = find_chapter_pages(pdf_path, skip_pages)
+def _extract_via_scan(pdf_path: str, doc, output_dir, skip_pages: int) -> list:
+    """Generic path: pattern-scan pages, reusing scanned text for stitching."""
+    print("\nNo PDF outline found, using text pattern matching...")
+    page_texts = [None] * doc.page_count
+    chapters = find_chapter_pages_by_pattern(doc, skip_pages, page_texts)
 
     if not chapters:
         print("Error: No chapters found!")
         return []
 
-    chapters_meta = []
+    print(f"Found {len(chapters)} chapters via pattern matching")
+    return _save_chapters(pdf_path, doc, chapters, output_dir, page_texts)
 
-    with pdfplumber.open(pdf_path) as pdf:
-        total_pages = len(pdf.pages)
 
-        for i, (chapter_num, title, start_page) in enumerate(chapters):
-            # Determine end page
-            if i + 1 < len(chapters):
-                end_page = chapters[i + 1][2]  # page_index of next chapter
-            else:
-                end_page = total_pages
+def extract_chapters_pdf(pdf_path: str, output_dir: str, skip_pages: int = 10) -> list:
+    """
+    Extract chapters from PDF and save as text files.
 
-            # Extract text
-            chapter_text = []
-            for page_num in range(start_page, end_page):
-                if page_num < total_pages:
-                    text = pdf.pages[page_num].extract_text()
-                    if text:
-                        chapter_text.append(text)
+    Args:
+        pdf_path: Path to PDF file
+        output_dir: Directory to save chapter files
+        skip_pages: Number of pages to skip
 
-            combined_text = "\n\n".join(chapter_text)
+    Returns:
+        List of chapter metadata dictionaries
+    """
+    from pathlib import Path
 
-            # Skip empty chapters
-            if not combined_text.strip():
-                print(f"  Skipping Chapter {chapter_num}: '{title}' (empty)")
-                continue
+    output_dir = Path(output_dir)
+    ensure_dir(output_dir)
 
-            # Save chapter
-            chapter_file = output_dir / f"chapter_{chapter_num:02d}.txt"
-            with open(chapter_file, 'w', encoding='utf-8') as f:
-                f.write(f"{chapter_num}. {title}\n\n")
-                f.write(combined_text)
-
-            meta = {
-                'number': chapter_num,
-                'title': title,
-                'pages': end_page - start_page,
-                'chars': len(combined_text),
-                'file': chapter_file.name
-            }
-            chapters_meta.append(meta)
-
-            print(f"  Chapter {chapter_num}: '{title}' - {len(combined_text):,} chars ({end_page - start_page} pages)")
+    # Open the PDF once and share the parsed document between detection
+    # and extraction (re-opening re-parses the xref and page tree).
+    with fitz.open(pdf_path) as doc:
+        # TOC fast path first; fall back to the scan path only when the
+        # PDF carries no usable outline
+        chapters_meta = _extract_via_toc(pdf_path, doc, output_dir)
+        if chapters_meta is None:
+            chapters_meta = _extract_via_scan(pdf_path, doc, output_dir, skip_pages)
 
     return chapters_meta
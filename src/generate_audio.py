@@ -2,81 +2,185 @@
 """
 Generate audio files for translated chapters using TTS.
 Supports paragraph-based chunking for long chapters.
+Chunks are submitted concurrently (asyncio) under the QPM rate limit.
 """
 
 import argparse
+import asyncio
+import os
+import re
+import shutil
 import time
 from pathlib import Path
 from collections import deque
 
 from config import (
-    get_openai_client, TTS_API_KEY,
-    TTS_MODEL, TTS_VOICE, TTS_QPM, MAX_RETRIES, MAX_AUDIO_CHUNK
+    get_async_openai_client, TTS_API_KEY,
+    TTS_MODEL, TTS_VOICE, TTS_QPM, TTS_OUTPUT_FORMAT, TTS_SPEED,
+    MAX_RETRIES, MAX_AUDIO_CHUNK
 )
 
+# Upper bound on concurrently in-flight TTS requests; the RateLimiter
+# still paces dispatch to the configured QPM
+MAX_CONCURRENCY = min(TTS_QPM, 16)
 
-class RateLimiter:
-    """Rate limiter for TTS API"""
+# Optional speech parameters, only sent when they differ from the API
+# defaults so gateways that reject unknown fields keep working
+_TTS_EXTRA_KWARGS = {}
+if TTS_OUTPUT_FORMAT != 'mp3':
+    _TTS_EXTRA_KWARGS['response_format'] = TTS_OUTPUT_FORMAT
+if TTS_SPEED != 1.0:
+    _TTS_EXTRA_KWARGS['speed'] = TTS_SPEED
 
-    def __init__(self, qpm):
-        self.qpm = qpm
-        self.min_delay = 60.0 / qpm
-        self.request_times = deque(maxlen=qpm)
+# Sentence segments (text up to and including a run of CJK/Latin
+# sentence enders), compiled once for the oversized-paragraph split.
+# The alternation makes the matches cover the paragraph exactly —
+# ender runs ("?!", "..."), leading enders and trailing fragments are
+# all kept, so joining the segments reproduces the input verbatim
+_SENT_RE = re.compile(r'[^。！？.!?]*[。！？.!?]+|[^。！？.!?]+')
 
-    def wait_if_needed(self):
-        now = time.time()
 
-        if len(self.request_times) > 0:
-            time_since_last = now - self.request_times[-1]
-            if time_since_last < self.min_delay:
-                sleep_time = self.min_delay - time_since_last
-                print(f"      Rate limiting: {sleep_time:.1f}s", end='', flush=True)
-                time.sleep(sleep_time)
-                now = time.time()
+class RateLimiter:
+    """Adaptive rate limiter for TTS API, safe for concurrent async tasks.
+
+    Paces requests toward a target QPM and adjusts it AIMD-style from
+    live feedback: healthy responses nudge the rate back up additively,
+    throttling/server errors halve it and honor the server's Retry-After,
+    so throughput settles at the provider's true limit instead of burning
+    retry budget on 60s head-of-line sleeps."""
 
-        if len(self.request_times) >= self.qpm:
-            time_since_oldest = now - self.request_times[0]
-            if time_since_oldest < 60.0:
-                sleep_time = 60.0 - time_since_oldest
-                print(f"      QPM limit: {sleep_time:.1f}s", end='', flush=True)
-                time.sleep(sleep_time)
+    # AIMD parameters: additive increase per success, multiplicative
+    # decrease on throttling
+    INCREASE_QPM = 0.5
+    DECREASE_FACTOR = 0.5
+    MIN_QPM = 1.0
+
+    def __init__(self, qpm):
+        self.max_qpm = qpm
+        self.qpm = float(qpm)
+        self.request_times = deque(maxlen=qpm)
+        self._lock = asyncio.Lock()
+        self._resume_at = 0.0  # absolute time before which dispatch pauses
+
+    @property
+    def min_delay(self):
+        return 60.0 / self.qpm
+
+    async def wait_if_needed(self):
+        # The lock serializes dispatch so concurrent tasks cannot burst
+        # past the QPM window between check and append
+        async with self._lock:
+            now = time.time()
+
+            if self._resume_at > now:
+                sleep_time = self._resume_at - now
+                print(f"      Retry-After backoff: {sleep_time:.1f}s")
+                await asyncio.sleep(sleep_time)
                 now = time.time()
 
-        self.request_times.append(now)
+            if len(self.request_times) > 0:
+                time_since_last = now - self.request_times[-1]
+                if time_since_last < self.min_delay:
+                    sleep_time = self.min_delay - time_since_last
+                    print(f"      Rate limiting: {sleep_time:.1f}s")
+                    await asyncio.sleep(sleep_time)
+                    now = time.time()
+
+            if len(self.request_times) >= self.qpm:
+                time_since_oldest = now - self.request_times[0]
+                if time_since_oldest < 60.0:
+                    sleep_time = 60.0 - time_since_oldest
+                    print(f"      QPM limit: {sleep_time:.1f}s")
+                    await asyncio.sleep(sleep_time)
+                    now = time.time()
+
+            self.request_times.append(now)
+
+    def observe_success(self, headers=None):
+        """Additive increase toward the configured ceiling.
+
+        When the server reports its remaining request quota, hold the
+        rate steady while the quota is nearly exhausted."""
+        remaining = None
+        if headers is not None:
+            try:
+                remaining = int(headers.get('x-ratelimit-remaining-requests'))
+            except (TypeError, ValueError):
+                remaining = None
+
+        if remaining is not None and remaining <= 1:
+            return
+        self.qpm = min(float(self.max_qpm), self.qpm + self.INCREASE_QPM)
+
+    def observe_failure(self, retry_after: float = None):
+        """Multiplicative decrease on 429/5xx; honor Retry-After."""
+        self.qpm = max(self.MIN_QPM, self.qpm * self.DECREASE_FACTOR)
+        if retry_after:
+            self._resume_at = max(self._resume_at, time.time() + retry_after)
+
+
+def _retry_after_seconds(exc) -> float:
+    """Pull a Retry-After value (seconds) from an API error, if any."""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
 
 
 def init_client():
-    """Initialize OpenAI client for TTS"""
-    return get_openai_client(api_key=TTS_API_KEY)
+    """Initialize async OpenAI client for TTS"""
+    return get_async_openai_client(api_key=TTS_API_KEY)
+
+
+def _paragraph_spans(text: str) -> list:
+    """Locate non-empty paragraphs as (start, end) offsets into text.
+
+    Edges are trimmed of whitespace in place, so nothing is copied until
+    a chunk is actually emitted."""
+    spans = []
+    pos = 0
+    length = len(text)
+    while pos <= length:
+        sep = text.find('\n\n', pos)
+        end = length if sep == -1 else sep
+        start = pos
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+        if sep == -1:
+            break
+        pos = sep + 2
+    return spans
 
 
 def split_by_paragraphs(text: str) -> list:
-    """Split text into chunks by paragraph boundaries"""
-    paragraphs = text.split('\n\n')
-    chunks = []
-    current_chunk = []
-    current_size = 0
-
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
-            continue
+    """Split text into chunks by paragraph boundaries.
 
-        para_size = len(para)
+    Chunks are emitted as single slices of the original string: the
+    greedy pass only advances a (cur_start, cur_end) window over the
+    paragraph spans, so no per-chunk paragraph lists are accumulated and
+    re-joined."""
+    chunks = []
+    cur_start = None
+    cur_end = 0
 
-        if para_size > MAX_AUDIO_CHUNK:
-            if current_chunk:
-                chunks.append('\n\n'.join(current_chunk))
-                current_chunk = []
-                current_size = 0
+    for start, end in _paragraph_spans(text):
+        if end - start > MAX_AUDIO_CHUNK:
+            if cur_start is not None:
+                chunks.append(text[cur_start:cur_end])
+                cur_start = None
 
-            # Split large paragraph by sentences
-            sentences = []
-            for delimiter in ['。', '！', '？', '.', '!', '?']:
-                if delimiter in para:
-                    parts = para.split(delimiter)
-                    sentences = [s + delimiter for s in parts[:-1]] + [parts[-1]]
-                    break
+            # Split large paragraph by sentences in one compiled pass
+            # (previously up to six sequential scans, and only the
+            # first-found delimiter was honored)
+            para = text[start:end]
+            sentences = _SENT_RE.findall(para)
 
             if not sentences:
                 sentences = [para]
@@ -95,70 +199,134 @@ def split_by_paragraphs(text: str) -> list:
             if temp_chunk:
                 chunks.append(''.join(temp_chunk))
 
-        elif current_size + para_size + 2 > MAX_AUDIO_CHUNK:
-            if current_chunk:
-                chunks.append('\n\n'.join(current_chunk))
-            current_chunk = [para]
-            current_size = para_size
+        elif cur_start is not None and end - cur_start > MAX_AUDIO_CHUNK:
+            chunks.append(text[cur_start:cur_end])
+            cur_start, cur_end = start, end
         else:
-            current_chunk.append(para)
-            current_size += para_size + 2
+            if cur_start is None:
+                cur_start = start
+            cur_end = end
+
+    if cur_start is not None:
+        chunks.append(text[cur_start:cur_end])
+
+    return _merge_small_chunks(chunks)
 
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
 
-    return chunks
+def _merge_small_chunks(chunks: list) -> list:
+    """Re-merge consecutive chunks that together still fit the TTS limit.
+
+    The sentence-level fallback for oversized paragraphs can leave a run
+    of small fragments behind it; every chunk is one TTS request, so
+    packing them back together cuts the request count."""
+    merged = []
+    for chunk in chunks:
+        if merged and len(merged[-1]) + 2 + len(chunk) <= MAX_AUDIO_CHUNK:
+            merged[-1] = f"{merged[-1]}\n\n{chunk}"
+        else:
+            merged.append(chunk)
+    return merged
 
 
-def generate_audio_chunk(client, rate_limiter, text: str, output_path: Path) -> bool:
+async def generate_audio_chunk(client, rate_limiter, text: str, output_path: Path,
+                               label: str = "Chunk") -> bool:
     """Generate audio for a single chunk"""
     for attempt in range(MAX_RETRIES):
         try:
-            rate_limiter.wait_if_needed()
+            await rate_limiter.wait_if_needed()
             start_time = time.time()
 
-            with client.audio.speech.with_streaming_response.create(
+            async with client.audio.speech.with_streaming_response.create(
                 model=TTS_MODEL,
                 voice=TTS_VOICE,
-                input=text
+                input=text,
+                **_TTS_EXTRA_KWARGS
             ) as response:
-                response.stream_to_file(str(output_path))
+                await response.stream_to_file(str(output_path))
+                rate_limiter.observe_success(getattr(response, 'headers', None))
 
             duration = time.time() - start_time
             file_size = output_path.stat().st_size
-            print(f" {duration:.1f}s ({file_size/1024:.0f}KB)")
+            print(f"    {label}: {duration:.1f}s ({file_size/1024:.0f}KB)")
             return True
 
         except Exception as e:
-            print(f" Failed: {e}")
+            status = getattr(e, 'status_code', None)
+            if status == 429 or (status is not None and status >= 500):
+                rate_limiter.observe_failure(_retry_after_seconds(e))
+            print(f"    {label}: Failed: {e}")
             if attempt < MAX_RETRIES - 1:
-                time.sleep(2 ** attempt)
+                await asyncio.sleep(2 ** attempt)
 
     return False
 
 
+def _kernel_copy(infile, outfile) -> bool:
+    """Copy infile into outfile entirely in-kernel via copy_file_range.
+
+    No data passes through user space. Returns False (with nothing
+    written) when the syscall is unavailable or unsupported for this
+    file pair, so the caller can fall back to a buffered copy.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+
+    in_fd = infile.fileno()
+    out_fd = outfile.fileno()
+    size = os.fstat(in_fd).st_size
+    offset = 0
+    while offset < size:
+        try:
+            copied = os.copy_file_range(in_fd, out_fd, size - offset, offset)
+        except OSError:
+            if offset == 0:
+                return False  # e.g. cross-device on older kernels
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return offset >= size
+
+
 def merge_audio_parts(audio_dir: Path, chapter_num: int, num_parts: int) -> bool:
-    """Merge audio parts into a single file"""
-    part_files = [audio_dir / f'chapter_{chapter_num:02d}_part{i:02d}.mp3'
+    """Merge audio parts into a single file.
+
+    Parts are joined by byte concatenation; config restricts
+    TTS_OUTPUT_FORMAT to containers where that yields a playable file."""
+    part_files = [audio_dir / f'chapter_{chapter_num:02d}_part{i:02d}.{TTS_OUTPUT_FORMAT}'
                   for i in range(1, num_parts + 1)]
 
-    if not all(f.exists() for f in part_files):
+    # One directory listing instead of a stat call per part
+    with os.scandir(audio_dir) as entries:
+        present = {entry.name for entry in entries}
+    if not all(f.name in present for f in part_files):
         return False
 
-    full_file = audio_dir / f'chapter_{chapter_num:02d}_full.mp3'
+    full_file = audio_dir / f'chapter_{chapter_num:02d}_full.{TTS_OUTPUT_FORMAT}'
 
-    with open(full_file, 'wb') as outfile:
+    # 1 MiB output buffer: the copyfileobj fallback then issues one
+    # syscall per buffer instead of one per default-sized block
+    with open(full_file, 'wb', buffering=1024 * 1024) as outfile:
         for part_file in part_files:
             with open(part_file, 'rb') as infile:
-                outfile.write(infile.read())
+                # Hint sequential access so the kernel reads ahead
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(infile.fileno(), 0, 0,
+                                     os.POSIX_FADV_SEQUENTIAL)
+                # Prefer an in-kernel copy; fall back to streaming the
+                # part through a 1 MiB user-space buffer
+                outfile.flush()
+                if not _kernel_copy(infile, outfile):
+                    shutil.copyfileobj(infile, outfile, 1024 * 1024)
 
     file_size = full_file.stat().st_size / (1024 * 1024)
     print(f"    Merged: {full_file.name} ({file_size:.2f} MB)")
     return True
 
 
-def generate_audio_for_chapter(client, rate_limiter, chapter_num: int, text: str, audio_dir: Path) -> bool:
-    """Generate audio for a chapter"""
+async def generate_audio_for_chapter(client, rate_limiter, semaphore,
+                                     chapter_num: int, text: str, audio_dir: Path) -> bool:
+    """Generate audio for a chapter, submitting chunks concurrently"""
     print(f"  Chapter {chapter_num} ({len(text):,} chars)")
 
     # Remove markdown for cleaner audio
@@ -167,22 +335,25 @@ def generate_audio_for_chapter(client, rate_limiter, chapter_num: int, text: str
     chunks = split_by_paragraphs(clean_text)
     print(f"    {len(chunks)} chunks")
 
-    success_count = 0
-    for idx, chunk in enumerate(chunks, 1):
-        if len(chunks) == 1:
-            output_path = audio_dir / f"chapter_{chapter_num:02d}_full.mp3"
-        else:
-            output_path = audio_dir / f"chapter_{chapter_num:02d}_part{idx:02d}.mp3"
-
+    async def run_chunk(idx: int, chunk: str, output_path: Path) -> bool:
         if output_path.exists():
             print(f"    Chunk {idx}: Already exists")
-            success_count += 1
-            continue
+            return True
+        async with semaphore:
+            return await generate_audio_chunk(
+                client, rate_limiter, chunk, output_path,
+                label=f"Chunk {idx}/{len(chunks)} ({len(chunk):,} chars)")
 
-        print(f"    Chunk {idx}/{len(chunks)} ({len(chunk):,} chars)...", end='', flush=True)
+    tasks = []
+    for idx, chunk in enumerate(chunks, 1):
+        if len(chunks) == 1:
+            output_path = audio_dir / f"chapter_{chapter_num:02d}_full.{TTS_OUTPUT_FORMAT}"
+        else:
+            output_path = audio_dir / f"chapter_{chapter_num:02d}_part{idx:02d}.{TTS_OUTPUT_FORMAT}"
+        tasks.append(asyncio.create_task(run_chunk(idx, chunk, output_path)))
 
-        if generate_audio_chunk(client, rate_limiter, chunk, output_path):
-            success_count += 1
+    results = await asyncio.gather(*tasks)
+    success_count = sum(1 for ok in results if ok)
 
     if success_count == len(chunks) and len(chunks) > 1:
         merge_audio_parts(audio_dir, chapter_num, len(chunks))
@@ -190,16 +361,13 @@ def generate_audio_for_chapter(client, rate_limiter, chapter_num: int, text: str
     return success_count == len(chunks)
 
 
-def generate_audio(input_dir: str, output_dir: str, chapters: str = None):
-    """Generate audio for chapters"""
-    input_dir = Path(input_dir)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-
+async def _generate_audio_async(input_dir: Path, output_dir: Path, chapters: str = None):
+    """Generate audio for chapters (async driver)"""
     # Initialize
     print(f"TTS Model: {TTS_MODEL}, Voice: {TTS_VOICE}, QPM: {TTS_QPM}\n")
     client = init_client()
     rate_limiter = RateLimiter(TTS_QPM)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
 
     # Get translation files
     trans_files = sorted(input_dir.glob('chapter_*_cn.md'))
@@ -223,14 +391,15 @@ def generate_audio(input_dir: str, output_dir: str, chapters: str = None):
         chapter_num = int(trans_file.stem.split('_')[1])
 
         # Check if already done
-        full_audio = output_dir / f'chapter_{chapter_num:02d}_full.mp3'
+        full_audio = output_dir / f'chapter_{chapter_num:02d}_full.{TTS_OUTPUT_FORMAT}'
         if full_audio.exists():
             print(f"  Chapter {chapter_num}: Already done")
             success += 1
             continue
 
         text = trans_file.read_text(encoding='utf-8')
-        if generate_audio_for_chapter(client, rate_limiter, chapter_num, text, output_dir):
+        if await generate_audio_for_chapter(client, rate_limiter, semaphore,
+                                            chapter_num, text, output_dir):
             success += 1
 
     print(f"\n{'='*60}")
@@ -239,6 +408,15 @@ def generate_audio(input_dir: str, output_dir: str, chapters: str = None):
     print(f"{'='*60}")
 
 
+def generate_audio(input_dir: str, output_dir: str, chapters: str = None):
+    """Generate audio for chapters"""
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    asyncio.run(_generate_audio_async(input_dir, output_dir, chapters))
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generate audio for translated chapters')
     parser.add_argument('input_dir', help='Directory containing translated chapter files')
@@ -8,16 +8,144 @@ Generate website files for a book:
 
 import argparse
 import json
+import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-import markdown
+from jinja2 import Environment, DictLoader
+from markdown_it import MarkdownIt
+
+from config import TTS_OUTPUT_FORMAT, TTS_AUDIO_MIME
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Compiled markdown parser, instantiated once so token rules are reused
+# across chapters (markdown-it-py renders several times faster than the
+# regex-heavy Python-Markdown 'extra' pipeline)
+_md = MarkdownIt('commonmark', {'html': False}).enable(['table', 'strikethrough'])
+
+
+_CHAPTER_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>第 {{ chapter_num }} 章: {{ title }} - {{ book_title }}</title>
+    <link rel="stylesheet" href="../../../css/style.css">
+    <style>
+        .chapter-summary-box {
+            background: #f0f8ff;
+            padding: 20px;
+            border-radius: 8px;
+            margin: 20px 0;
+            border-left: 4px solid #3498db;
+        }
+        .chapter-summary-box h3 { margin-top: 0; color: #2c3e50; }
+        .chapter-summary-box p { line-height: 1.8; white-space: pre-wrap; }
+        .audio-player { margin: 20px 0; padding: 15px; background: #f5f5f5; border-radius: 8px; }
+        .audio-player audio { width: 100%; }
+    </style>
+</head>
+<body>
+    <div class="container chapter-detail">
+        <a href="../index.html" class="back-link">&larr; 返回目录</a>
+
+        <div class="chapter-header">
+            <h1>第 {{ chapter_num }} 章: {{ title }}</h1>
+        </div>
+
+        {% if summary %}
+        <div class="chapter-summary-box">
+            <h3>章节摘要</h3>
+            <p>{{ summary }}</p>
+        </div>
+        {% endif %}
+        {% if has_audio %}
+        <div class="audio-player">
+            <h3>章节音频</h3>
+            <audio controls>
+                <source src="../audio/chapter_{{ '%02d' % chapter_num }}_full.{{ audio_ext }}" type="{{ audio_mime }}">
+                您的浏览器不支持音频播放。
+            </audio>
+        </div>
+        {% endif %}
+
+        <div class="chapter-content">
+            {{ content_html | safe }}
+        </div>
+
+        <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd;">
+            <a href="../index.html" class="back-link">&larr; 返回目录</a>
+        </div>
+    </div>
+</body>
+</html>'''
+
+_INDEX_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ book_title }} - 中文翻译</title>
+    <link rel="stylesheet" href="../../css/style.css">
+</head>
+<body>
+    <div class="container">
+        <header>
+            <h1>{{ book_title }}</h1>
+            <p class="subtitle">中文翻译版 | {{ chapters | length }} 章节</p>
+        </header>
+
+        <div class="chapters-grid">
+            {% for ch in chapters %}
+            <div class="chapter-card" onclick="location.href='chapters/{{ ch.file }}'">
+                <div class="chapter-number">第 {{ ch.number }} 章</div>
+                <div class="chapter-title">{{ ch.title }}</div>
+                <div class="chapter-summary">{{ ch.summary }}</div>
+                <div class="chapter-meta">
+                    <span>{{ '{:,}'.format(ch.wordCount) }} 字</span>
+                    {% if ch.hasAudio %}<span class="audio-badge">🔊</span>{% endif %}
+                </div>
+            </div>
+            {% endfor %}
+        </div>
+
+        <footer>
+            <p>由 AI 翻译生成 | <a href="../../index.html">返回书籍列表</a></p>
+        </footer>
+    </div>
+</body>
+</html>'''
+
+# Templates compiled once at import; rendering per chapter then runs the
+# pre-compiled code object instead of re-parsing an f-string skeleton and
+# concatenating fragments. The markdown output is already HTML, so only
+# content_html is exempted from autoescaping (|safe in the template).
+_env = Environment(loader=DictLoader({
+    'chapter.html': _CHAPTER_TEMPLATE,
+    'index.html': _INDEX_TEMPLATE,
+}), autoescape=True)
+_chapter_tpl = _env.get_template('chapter.html')
+_index_tpl = _env.get_template('index.html')
+
+
+@lru_cache(maxsize=None)
+def _read(path_str: str) -> str:
+    """Read a text file once per process; repeat calls hit the cache.
+
+    Several helpers below need the same translation/summary file, and
+    without the cache each chapter was read and decoded several times."""
+    return Path(path_str).read_text(encoding='utf-8')
 
 
 def get_summary(summary_dir: Path, chapter_num: int) -> str:
     """Get chapter summary preview"""
-    summary_file = summary_dir / f'chapter_{chapter_num:02d}_summary.txt'
-    if summary_file.exists():
-        summary = summary_file.read_text(encoding='utf-8').strip()
+    summary = get_full_summary(summary_dir, chapter_num)
+    if summary:
         return summary[:200] + '...' if len(summary) > 200 else summary
     return "暂无摘要"
 
@@ -26,48 +154,98 @@ def get_full_summary(summary_dir: Path, chapter_num: int) -> str:
     """Get full chapter summary"""
     summary_file = summary_dir / f'chapter_{chapter_num:02d}_summary.txt'
     if summary_file.exists():
-        return summary_file.read_text(encoding='utf-8').strip()
+        return _read(str(summary_file)).strip()
     return ""
 
 
 def has_audio(audio_dir: Path, chapter_num: int) -> bool:
     """Check if chapter has audio"""
-    return (audio_dir / f'chapter_{chapter_num:02d}_full.mp3').exists()
+    return (audio_dir / f'chapter_{chapter_num:02d}_full.{TTS_OUTPUT_FORMAT}').exists()
+
+
+def _dir_names(path: Path) -> set:
+    """List a directory's entry names with one scandir pass.
+
+    Per-chapter exists() probes each cost a stat syscall; checking
+    membership in this set is a hash lookup."""
+    if not path.is_dir():
+        return set()
+    with os.scandir(path) as entries:
+        return {entry.name for entry in entries}
 
 
 def get_word_count(trans_file: Path) -> int:
     """Count Chinese characters"""
     if trans_file.exists():
-        text = trans_file.read_text(encoding='utf-8')
+        text = _read(str(trans_file))
+        if np is not None:
+            # One vectorized range compare over the codepoints instead of
+            # a Python-level iteration per character
+            arr = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+            return int(np.count_nonzero((arr >= 0x4E00) & (arr <= 0x9FFF)))
         return sum(1 for c in text if '\u4e00' <= c <= '\u9fff')
     return 0
 
 
-def extract_title(trans_file: Path, chapter_num: int) -> str:
-    """Extract chapter title from translation file"""
-    if trans_file.exists():
-        first_line = trans_file.read_text(encoding='utf-8').split('\n')[0]
-        # Remove chapter number prefix if present
-        if first_line.startswith(f"{chapter_num}."):
-            return first_line[len(f"{chapter_num}."):].strip()
-        return first_line.strip()
-    return f"Chapter {chapter_num}"
+def extract_title(trans_file: Path, chapter_num: int, text: str = None) -> str:
+    """Extract chapter title from translation file (or given text)"""
+    if text is not None:
+        first_line = text.split('\n', 1)[0]
+    else:
+        # Only the first line matters: read just that instead of pulling
+        # the whole chapter into memory
+        try:
+            with open(trans_file, encoding='utf-8') as f:
+                first_line = f.readline()
+        except FileNotFoundError:
+            return f"Chapter {chapter_num}"
+    # Remove chapter number prefix if present
+    if first_line.startswith(f"{chapter_num}."):
+        return first_line[len(f"{chapter_num}."):].strip()
+    return first_line.strip()
 
 
 def generate_chapters_json(trans_dir: Path, summary_dir: Path, audio_dir: Path, output_file: Path):
-    """Generate chapters.json metadata file"""
+    """Generate chapters.json metadata file.
+
+    Returns (chapters, contents, summaries): the metadata list plus the
+    chapter texts and full summaries read along the way, keyed by chapter
+    number. Callers hand these to the chapter-page workers so the same
+    files aren't read again in every pool process (the read cache is
+    per-process and does not survive pickling).
+    """
     chapters = []
+    contents = {}
+    summaries = {}
 
     trans_files = sorted(trans_dir.glob('chapter_*_cn.md'))
 
+    # One directory listing each replaces a pair of stat calls per chapter
+    summary_names = _dir_names(summary_dir)
+    audio_names = _dir_names(audio_dir)
+
     for trans_file in trans_files:
         chapter_num = int(trans_file.stem.split('_')[1])
+        content = _read(str(trans_file))
+
+        summary = ''
+        summary_name = f'chapter_{chapter_num:02d}_summary.txt'
+        if summary_name in summary_names:
+            summary = _read(str(summary_dir / summary_name)).strip()
+
+        contents[chapter_num] = content
+        summaries[chapter_num] = summary
+
+        if summary:
+            preview = summary[:200] + '...' if len(summary) > 200 else summary
+        else:
+            preview = "暂无摘要"
 
         chapter_data = {
             'number': chapter_num,
-            'title': extract_title(trans_file, chapter_num),
-            'summary': get_summary(summary_dir, chapter_num),
-            'hasAudio': has_audio(audio_dir, chapter_num),
+            'title': extract_title(trans_file, chapter_num, content),
+            'summary': preview,
+            'hasAudio': f'chapter_{chapter_num:02d}_full.{TTS_OUTPUT_FORMAT}' in audio_names,
             'wordCount': get_word_count(trans_file),
             'file': f'chapter_{chapter_num:02d}.html'
         }
@@ -79,143 +257,98 @@ def generate_chapters_json(trans_dir: Path, summary_dir: Path, audio_dir: Path,
         json.dump(chapters, f, ensure_ascii=False, indent=2)
 
     print(f"Generated {output_file} with {len(chapters)} chapters")
-    return chapters
-
-
-def generate_chapter_html(chapter_num: int, trans_file: Path, summary_dir: Path,
-                         audio_dir: Path, output_dir: Path, book_title: str):
-    """Generate HTML page for a chapter"""
-    content = trans_file.read_text(encoding='utf-8')
-    title = extract_title(trans_file, chapter_num)
-
-    # Convert markdown to HTML
-    content_html = markdown.markdown(content, extensions=['extra'])
-
-    # Audio section
-    audio_html = ''
-    if has_audio(audio_dir, chapter_num):
-        audio_html = f'''
-        <div class="audio-player">
-            <h3>章节音频</h3>
-            <audio controls>
-                <source src="../audio/chapter_{chapter_num:02d}_full.mp3" type="audio/mpeg">
-                您的浏览器不支持音频播放。
-            </audio>
-        </div>'''
-
-    # Summary section
-    summary_html = ''
-    full_summary = get_full_summary(summary_dir, chapter_num)
-    if full_summary:
-        summary_html = f'''
-        <div class="chapter-summary-box">
-            <h3>章节摘要</h3>
-            <p>{full_summary}</p>
-        </div>'''
-
-    # HTML template
-    html = f'''<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>第 {chapter_num} 章: {title} - {book_title}</title>
-    <link rel="stylesheet" href="../../../css/style.css">
-    <style>
-        .chapter-summary-box {{
-            background: #f0f8ff;
-            padding: 20px;
-            border-radius: 8px;
-            margin: 20px 0;
-            border-left: 4px solid #3498db;
-        }}
-        .chapter-summary-box h3 {{ margin-top: 0; color: #2c3e50; }}
-        .chapter-summary-box p {{ line-height: 1.8; white-space: pre-wrap; }}
-        .audio-player {{ margin: 20px 0; padding: 15px; background: #f5f5f5; border-radius: 8px; }}
-        .audio-player audio {{ width: 100%; }}
-    </style>
-</head>
-<body>
-    <div class="container chapter-detail">
-        <a href="../index.html" class="back-link">&larr; 返回目录</a>
+    return chapters, contents, summaries
 
-        <div class="chapter-header">
-            <h1>第 {chapter_num} 章: {title}</h1>
-        </div>
 
-        {summary_html}
-        {audio_html}
+def generate_chapter_html(chapter_num: int, trans_file, summary_dir,
+                         audio_dir, output_dir, book_title: str,
+                         content: str = None, summary: str = None):
+    """Generate HTML page for a chapter.
 
-        <div class="chapter-content">
-            {content_html}
-        </div>
+    Paths may be given as strings so the call pickles cheaply when
+    dispatched through the process pool. content/summary, when provided,
+    skip re-reading files already loaded by generate_chapters_json."""
+    trans_file = Path(trans_file)
+    summary_dir = Path(summary_dir)
+    audio_dir = Path(audio_dir)
+    output_dir = Path(output_dir)
 
-        <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd;">
-            <a href="../index.html" class="back-link">&larr; 返回目录</a>
-        </div>
-    </div>
-</body>
-</html>'''
+    if content is None:
+        content = _read(str(trans_file))
+    if summary is None:
+        summary = get_full_summary(summary_dir, chapter_num)
+    title = extract_title(trans_file, chapter_num, content)
 
+    # Convert markdown to HTML
+    content_html = _md.render(content)
+
+    html = _chapter_tpl.render(
+        chapter_num=chapter_num,
+        title=title,
+        book_title=book_title,
+        summary=summary,
+        has_audio=has_audio(audio_dir, chapter_num),
+        audio_ext=TTS_OUTPUT_FORMAT,
+        audio_mime=TTS_AUDIO_MIME,
+        content_html=content_html,
+    )
+
+    # Pre-encode once and write the bytes directly, skipping the text
+    # layer's incremental encoder (same trick as the chapter extractors)
     output_file = output_dir / f'chapter_{chapter_num:02d}.html'
-    output_file.write_text(html, encoding='utf-8')
+    output_file.write_bytes(html.encode('utf-8'))
     print(f"  Generated {output_file.name}")
 
 
+def _render_chapter(args: tuple):
+    """Worker target: unpack one chapter's arguments for the pool."""
+    generate_chapter_html(*args)
+
+
 def generate_index_html(chapters: list, output_dir: Path, book_title: str, book_slug: str):
     """Generate book index page"""
-    chapters_html = ''
-    for ch in chapters:
-        audio_badge = '<span class="audio-badge">🔊</span>' if ch['hasAudio'] else ''
-        chapters_html += f'''
-        <div class="chapter-card" onclick="location.href='chapters/{ch['file']}'">
-            <div class="chapter-number">第 {ch['number']} 章</div>
-            <div class="chapter-title">{ch['title']}</div>
-            <div class="chapter-summary">{ch['summary']}</div>
-            <div class="chapter-meta">
-                <span>{ch['wordCount']:,} 字</span>
-                {audio_badge}
-            </div>
-        </div>'''
-
-    html = f'''<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{book_title} - 中文翻译</title>
-    <link rel="stylesheet" href="../../css/style.css">
-</head>
-<body>
-    <div class="container">
-        <header>
-            <h1>{book_title}</h1>
-            <p class="subtitle">中文翻译版 | {len(chapters)} 章节</p>
-        </header>
+    html = _index_tpl.render(book_title=book_title, chapters=chapters)
 
-        <div class="chapters-grid">
-            {chapters_html}
-        </div>
+    (output_dir / 'index.html').write_bytes(html.encode('utf-8'))
+    print(f"Generated index.html")
 
-        <footer>
-            <p>由 AI 翻译生成 | <a href="../../index.html">返回书籍列表</a></p>
-        </footer>
-    </div>
-</body>
-</html>'''
 
-    (output_dir / 'index.html').write_text(html, encoding='utf-8')
-    print(f"Generated index.html")
+def _sendfile_copy(src: Path, dst: Path) -> bool:
+    """Copy a file kernel-to-kernel via os.sendfile, preserving mtime.
+
+    Returns False when the syscall is unavailable or fails, so the
+    caller can fall back to a user-space copy."""
+    if not hasattr(os, 'sendfile'):
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        if offset < size:
+            return False
+        st = src.stat()
+        os.utime(dst, (st.st_atime, st.st_mtime))
+        return True
+    except OSError:
+        return False
 
 
 def copy_audio_files(audio_src: Path, audio_dest: Path):
     """Copy audio files to docs directory"""
     audio_dest.mkdir(parents=True, exist_ok=True)
 
-    for audio_file in audio_src.glob('*_full.mp3'):
+    for audio_file in audio_src.glob(f'*_full.{TTS_OUTPUT_FORMAT}'):
         dest_file = audio_dest / audio_file.name
         if not dest_file.exists():
-            shutil.copy(audio_file, dest_file)
+            # Zero-copy where the platform supports it; these files are
+            # routinely 5-20 MB each
+            if not _sendfile_copy(audio_file, dest_file):
+                shutil.copy(audio_file, dest_file)
             print(f"  Copied {audio_file.name}")
 
 
@@ -242,12 +375,14 @@ def generate_books_index(docs_base: str):
                     index_html = book_dir / 'index.html'
                     book_title = book_dir.name  # fallback to slug
                     if index_html.exists():
-                        content = index_html.read_text(encoding='utf-8')
-                        # Extract title from <h1> tag
-                        import re
-                        match = re.search(r'<h1>(.*?)</h1>', content)
-                        if match:
-                            book_title = match.group(1)
+                        # The <h1> sits in the page header: read only the
+                        # head of the file and find it with str.partition,
+                        # no regex engine involved
+                        with open(index_html, encoding='utf-8') as f:
+                            head = f.read(4096)
+                        title = head.partition('<h1>')[2].partition('</h1>')[0]
+                        if title:
+                            book_title = title
 
                     books.append({
                         'slug': book_dir.name,
@@ -343,16 +478,27 @@ def generate_website(book_slug: str, book_title: str, output_base: str, docs_bas
     print(f"\nGenerating website for: {book_title}")
     print(f"Output: {docs_dir}\n")
 
-    # Generate chapters.json
-    chapters = generate_chapters_json(trans_dir, summary_dir, audio_dir,
-                                      docs_data / 'chapters.json')
+    # Generate chapters.json (also yields the chapter texts/summaries it
+    # read, so the page workers below don't read the same files again)
+    chapters, contents, summaries = generate_chapters_json(
+        trans_dir, summary_dir, audio_dir, docs_data / 'chapters.json')
 
-    # Generate chapter HTML pages
+    # Generate chapter HTML pages: markdown rendering is pure CPU and
+    # independent per chapter, so farm it out to a process pool
     print("\nGenerating chapter pages...")
+    args_list = []
     for trans_file in sorted(trans_dir.glob('chapter_*_cn.md')):
         chapter_num = int(trans_file.stem.split('_')[1])
-        generate_chapter_html(chapter_num, trans_file, summary_dir, audio_dir,
-                            docs_chapters, book_title)
+        args_list.append((chapter_num, str(trans_file), str(summary_dir),
+                          str(audio_dir), str(docs_chapters), book_title,
+                          contents.get(chapter_num),
+                          summaries.get(chapter_num)))
+    if len(args_list) > 1:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            list(executor.map(_render_chapter, args_list, chunksize=4))
+    else:
+        for args in args_list:
+            _render_chapter(args)
 
     # Generate index page
     print("\nGenerating index page...")
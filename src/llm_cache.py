@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for chat-completion responses.
+
+Responses are stored one file per request digest, so re-running a stage
+after a partial failure (or with unchanged input) replays completed
+responses from disk instead of paying for the same tokens again.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Cache location; set LLM_CACHE_DIR to move it, LLM_CACHE=0 to disable
+CACHE_DIR = Path(os.getenv('LLM_CACHE_DIR', '.llm_cache'))
+CACHE_ENABLED = os.getenv('LLM_CACHE', '1') != '0'
+
+
+def cache_key(model: str, messages: list, temperature: float) -> str:
+    """Stable digest of everything that determines a response."""
+    payload = json.dumps([model, messages, temperature], ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def get(key: str):
+    """Return the cached response text, or None on a miss."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        return (CACHE_DIR / f"{key}.txt").read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None
+
+
+def put(key: str, text: str):
+    """Persist a response. Cache write failures never break the pipeline."""
+    if not CACHE_ENABLED or not text:
+        return
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so a crash mid-write can't leave a torn entry
+        tmp = CACHE_DIR / f"{key}.{os.getpid()}.tmp"
+        tmp.write_text(text, encoding='utf-8')
+        tmp.replace(CACHE_DIR / f"{key}.txt")
+    except OSError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Optional semantic layer: serves responses for near-identical inputs
+# (re-extractions, revised editions) that miss the exact digest above.
+# Off by default — an approximate hit substitutes a previous response, so
+# enable it only when inputs genuinely recur. Requires the optional
+# sentence-transformers and faiss packages; degrades to a no-op with a
+# one-time notice when they are missing.
+# ---------------------------------------------------------------------------
+
+SEMANTIC_ENABLED = os.getenv('LLM_SEMANTIC_CACHE', '0') == '1'
+SEMANTIC_THRESHOLD = float(os.getenv('LLM_SEMANTIC_THRESHOLD', 0.97))
+
+_semantic_model = None   # shared embedding model; False once known unavailable
+_semantic_indexes = {}   # one index per scope (prompt/mode identity)
+
+
+class _SemanticIndex:
+    """In-memory embedding index over responses stored this run."""
+
+    def __init__(self, model):
+        import faiss
+
+        self.model = model
+        self.index = faiss.IndexFlatIP(
+            self.model.get_sentence_embedding_dimension())
+        self.responses = []
+
+    def _embed(self, text: str):
+        return self.model.encode([text], normalize_embeddings=True)
+
+    def lookup(self, text: str):
+        if not self.responses:
+            return None
+        scores, ids = self.index.search(self._embed(text), 1)
+        if scores[0][0] >= SEMANTIC_THRESHOLD:
+            return self.responses[ids[0][0]]
+        return None
+
+    def add(self, text: str, response: str):
+        self.index.add(self._embed(text))
+        self.responses.append(response)
+
+
+def _get_semantic_index(scope: str):
+    """Index for one scope; the embedding model is loaded once and shared.
+
+    Scoping keeps responses produced under different prompts apart:
+    identical input text scores 1.0 regardless of the system message, so
+    without it a cleanup+translate response could answer a plain
+    translation request."""
+    global _semantic_model
+    if _semantic_model is None:
+        try:
+            import faiss  # noqa: F401  (fail early if missing)
+            from sentence_transformers import SentenceTransformer
+            _semantic_model = SentenceTransformer(
+                os.getenv('LLM_SEMANTIC_MODEL', 'all-MiniLM-L6-v2'))
+        except ImportError:
+            print("llm_cache: semantic cache requested but "
+                  "sentence-transformers/faiss are not installed; disabled")
+            _semantic_model = False
+    if not _semantic_model:
+        return None
+    if scope not in _semantic_indexes:
+        _semantic_indexes[scope] = _SemanticIndex(_semantic_model)
+    return _semantic_indexes[scope]
+
+
+def semantic_get(text: str, scope: str = ''):
+    """Return a response cached for a near-identical input in scope, or None."""
+    if not SEMANTIC_ENABLED:
+        return None
+    index = _get_semantic_index(scope)
+    return index.lookup(text) if index else None
+
+
+def semantic_put(text: str, response: str, scope: str = ''):
+    """Register a response so near-identical inputs in scope can reuse it."""
+    if not SEMANTIC_ENABLED or not response:
+        return
+    index = _get_semantic_index(scope)
+    if index:
+        index.add(text, response)
@@ -5,77 +5,22 @@ This step runs BEFORE translation to ensure clean source text.
 """
 
 import argparse
-import time
+import asyncio
+import re
 from pathlib import Path
 
 from config import (
-    get_openai_client, TRANSLATION_MODEL, TEMPERATURE, MAX_RETRIES,
-    PREPROCESS_CHUNK_SIZE,
+    get_async_openai_client, llm_retry, TRANSLATION_MODEL, TEMPERATURE,
+    PREPROCESS_MAX_INPUT_TOKENS, LLM_CONCURRENCY,
 )
+import llm_cache
+from chunking import split_into_chunks
 
 
-def _split_preprocess_chunks(text: str, max_chars: int) -> list:
-    """Split text into large chunks preferring paragraph boundaries ("\n\n").
-
-    - Greedily packs paragraphs until adding the next would exceed max_chars.
-    - If a single paragraph exceeds max_chars, fall back to sentence/space split.
-    """
-    paras = text.split("\n\n")
-    chunks = []
-    current = []
-    current_len = 0
-
-    def flush_current():
-        nonlocal current, current_len
-        if current:
-            chunks.append("\n\n".join(current).strip())
-            current = []
-            current_len = 0
-
-    for para in paras:
-        # Include separator length (two newlines) if current not empty
-        sep = 2 if current else 0
-        if current_len + sep + len(para) <= max_chars:
-            current.append(para)
-            current_len += sep + len(para)
-        else:
-            # If paragraph itself is too large, split within paragraph
-            if not current:
-                p = para
-                i = 0
-                while i < len(p):
-                    end = min(i + max_chars, len(p))
-                    chunk = p[i:end]
-                    # try to cut on sentence boundary within this oversized paragraph
-                    if end < len(p):
-                        last_break = max(
-                            chunk.rfind(". "),
-                            chunk.rfind("! "),
-                            chunk.rfind("? "),
-                            chunk.rfind(".\n"),
-                            chunk.rfind(" ")
-                        )
-                        if last_break > max_chars * 0.5:
-                            chunk = chunk[:last_break + 1]
-                            end = i + len(chunk)
-                    chunks.append(chunk.strip())
-                    i = end
-            else:
-                flush_current()
-                current.append(para)
-                current_len = len(para)
-
-    flush_current()
-
-    # Remove empties just in case
-    return [c for c in chunks if c]
-
-
-def _preprocess_chunk(client, chunk: str, chapter_num: int, idx: int, total: int) -> str:
-    """Clean PDF artifacts and add Markdown formatting for a single chunk."""
-    prompt = f"""You are a text preprocessing expert. Clean up this English book chapter PART and add Markdown formatting.
-
-This is part {idx} of {total} for Chapter {chapter_num}. Only process the given text span; do not assume context outside it.
+# All static instructions live in the system message, byte-identical on
+# every request, so the API's prompt-prefix cache can reuse them; only
+# the part marker and the chunk itself vary per request
+_PREPROCESS_SYSTEM_PROMPT = """You are a text preprocessing expert. You clean PDF-extracted text without rewriting, adding only minimal Markdown formatting. Clean up the given English book chapter PART and add Markdown formatting.
 
 TASK 1 - FIX PDF ARTIFACTS (within this part only):
 1. Merge paragraphs split by page breaks when clearly the same sentence/topic
@@ -92,7 +37,38 @@ TASK 2 - ADD MARKDOWN FORMATTING:
 RULES:
 - DO NOT change wording or meaning
 - DO NOT add or remove content
-- Only fix paragraph/sentence breaks and add minimal Markdown markers
+- Only fix paragraph/sentence breaks and add minimal Markdown markers"""
+
+
+# Telltale PDF artifacts: a word split by a line-break hyphen, an
+# all-caps running-header line, or a form feed
+_ARTIFACT_RE = re.compile(r'-\n|\n[A-Z][A-Z ]{4,}\n|\x0c')
+
+
+@llm_retry()
+async def _request_cleanup(client, messages: list) -> str:
+    """Dispatch one cleanup request; transient failures retry with backoff."""
+    response = await client.chat.completions.create(
+        model=TRANSLATION_MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=16000
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def _preprocess_chunk(client, chunk: str, chapter_num: int, idx: int, total: int) -> str:
+    """Clean PDF artifacts and add Markdown formatting for a single chunk."""
+    # A chunk with none of the artifact markers and a healthy blank-line
+    # density is already clean text (typically EPUB input); the cleanup
+    # request would only cost tokens to hand it back unchanged
+    if (_ARTIFACT_RE.search(chunk) is None
+            and chunk.count('\n\n') >= max(1, len(chunk) // 2000)):
+        print(f"    Chapter {chapter_num} part {idx}/{total}: "
+              "no PDF artifacts, skipping cleanup")
+        return chunk
+
+    prompt = f"""This is part {idx} of {total} for Chapter {chapter_num}. Only process the given text span; do not assume context outside it.
 
 Input text (with PDF artifacts):
 
@@ -100,62 +76,100 @@ Input text (with PDF artifacts):
 
 Cleaned and markdown-formatted text for this part:"""
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = client.chat.completions.create(
-                model=TRANSLATION_MODEL,
-                messages=[
-                    {"role": "system", "content": "You clean PDF-extracted text without rewriting, adding only minimal Markdown formatting."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=TEMPERATURE,
-                max_tokens=16000
-            )
-
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"    Part {idx}: attempt failed: {e}")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(2 ** attempt)
-            else:
-                return chunk  # fallback to original chunk
-
-
-def clean_and_format_chapter(client, text: str, chapter_num: int) -> str:
+    messages = [
+        {"role": "system", "content": _PREPROCESS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    cache_key = llm_cache.cache_key(TRANSLATION_MODEL, messages, TEMPERATURE)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await _request_cleanup(client, messages)
+    except Exception as e:
+        print(f"    Chapter {chapter_num} part {idx}: request failed: {e}")
+        return chunk  # fallback to original chunk
+
+    llm_cache.put(cache_key, result)
+    return result
+
+
+async def clean_and_format_chapter(client, semaphore, text: str, chapter_num: int) -> str:
     """Use GPT to clean PDF artifacts and add Markdown formatting with chunking.
 
     Splits the chapter content into large chunks using blank-line boundaries
     and processes each chunk independently to avoid context window limits.
+    Chunks run concurrently under the shared semaphore; gather keeps the
+    results in document order.
     """
-    print(f"  Processing Chapter {chapter_num}...")
-
-    chunks = _split_preprocess_chunks(text, PREPROCESS_CHUNK_SIZE)
+    chunks = split_into_chunks(text, PREPROCESS_MAX_INPUT_TOKENS)
     if len(chunks) > 1:
-        print(f"    Split into {len(chunks)} parts (≤{PREPROCESS_CHUNK_SIZE} chars each)")
+        print(f"    Chapter {chapter_num}: split into {len(chunks)} parts "
+              f"(≤{PREPROCESS_MAX_INPUT_TOKENS} tokens each)")
 
-    outputs = []
-    for idx, chunk in enumerate(chunks, 1):
-        print(f"    Part {idx}/{len(chunks)}...", end=' ', flush=True)
-        cleaned = _preprocess_chunk(client, chunk, chapter_num, idx, len(chunks))
-        outputs.append(cleaned)
-        print(f"Done ({len(cleaned):,} chars)")
-        time.sleep(1)
+    async def run_chunk(idx: int, chunk: str) -> str:
+        async with semaphore:
+            cleaned = await _preprocess_chunk(client, chunk, chapter_num, idx, len(chunks))
+        print(f"    Chapter {chapter_num} part {idx}/{len(chunks)} done "
+              f"({len(cleaned):,} chars)")
+        return cleaned
+
+    outputs = await asyncio.gather(
+        *(run_chunk(idx, chunk) for idx, chunk in enumerate(chunks, 1)))
 
     combined = "\n\n".join(outputs).strip()
-    print(f"    Done (before: {len(text):,}, after: {len(combined):,} chars)")
+    print(f"    Chapter {chapter_num} done (before: {len(text):,}, after: {len(combined):,} chars)")
     return combined
 
 
-def process_chapters(input_dir: str, output_dir: str, max_chapters: int = None):
+async def _process_chapters_async(chapter_files: list, output_dir: Path,
+                                  force: bool = False):
+    """Clean all chapters concurrently, a few chapters at a time.
+
+    One AsyncOpenAI client is shared by every request so the underlying
+    HTTP connections stay warm across chapters; the semaphore caps how
+    many chunk requests are in flight at once across all chapters.
+    """
+    client = get_async_openai_client()
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def run_chapter(chapter_file: Path):
+        chapter_num = int(chapter_file.stem.split('_')[1])
+
+        # Check if already processed, before touching the input file
+        output_file = output_dir / chapter_file.name
+        if output_file.exists() and not force:
+            print(f"Chapter {chapter_num}: Already processed, skipping")
+            return
+
+        # Read chapter: title off the first line, content in one read,
+        # without materializing a second full-text copy for the split
+        with open(chapter_file, 'r', encoding='utf-8') as f:
+            title = f.readline().rstrip('\n') or f"Chapter {chapter_num}"
+            content = f.read()
+
+        print(f"\nChapter {chapter_num}: {title}")
+        cleaned_content = await clean_and_format_chapter(
+            client, semaphore, content, chapter_num)
+
+        # Save
+        output_file.write_text(f"{title}\n\n{cleaned_content}", encoding='utf-8')
+
+    try:
+        await asyncio.gather(*(run_chapter(f) for f in chapter_files))
+    finally:
+        await client.close()
+
+
+def process_chapters(input_dir: str, output_dir: str, max_chapters: int = None,
+                     force: bool = False):
     """Process all chapters in input directory"""
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Initialize client
-    print("Initializing OpenAI client...")
-    client = get_openai_client()
-
     # Get chapter files
     chapter_files = sorted(input_dir.glob('chapter_*.txt'))
     if max_chapters:
@@ -163,26 +177,7 @@ def process_chapters(input_dir: str, output_dir: str, max_chapters: int = None):
 
     print(f"Found {len(chapter_files)} chapters to process\n")
 
-    # Process each chapter
-    for chapter_file in chapter_files:
-        chapter_num = int(chapter_file.stem.split('_')[1])
-
-        # Read chapter
-        text = chapter_file.read_text(encoding='utf-8')
-        lines = text.split('\n', 1)
-        title = lines[0] if lines else f"Chapter {chapter_num}"
-        content = lines[1] if len(lines) > 1 else text
-
-        print(f"\nChapter {chapter_num}: {title}")
-
-        # Clean and format
-        cleaned_content = clean_and_format_chapter(client, content, chapter_num)
-
-        # Save
-        output_file = output_dir / chapter_file.name
-        output_file.write_text(f"{title}\n\n{cleaned_content}", encoding='utf-8')
-
-        time.sleep(1)  # Rate limiting
+    asyncio.run(_process_chapters_async(chapter_files, output_dir, force=force))
 
     print(f"\n{'='*60}")
     print(f"All chapters preprocessed!")
@@ -195,10 +190,12 @@ def main():
     parser.add_argument('input_dir', help='Directory containing raw chapter files')
     parser.add_argument('output_dir', help='Directory to save processed files')
     parser.add_argument('--max', type=int, help='Process only first N chapters')
+    parser.add_argument('--force', action='store_true',
+                        help='Reprocess chapters even if output already exists')
 
     args = parser.parse_args()
 
-    process_chapters(args.input_dir, args.output_dir, args.max)
+    process_chapters(args.input_dir, args.output_dir, args.max, force=args.force)
 
 
 if __name__ == '__main__':
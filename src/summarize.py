@@ -4,16 +4,19 @@ Generate summaries for translated chapters.
 """
 
 import argparse
-import time
+import asyncio
 from pathlib import Path
 
 from config import (
-    get_openai_client, SUMMARY_MODEL, TEMPERATURE, MAX_RETRIES
+    get_openai_client, get_async_openai_client, llm_retry, SUMMARY_MODEL,
+    TEMPERATURE, LLM_CONCURRENCY,
 )
+import batch_api
+import llm_cache
 
 
-def generate_summary(client, chapter_num: int, text: str) -> str:
-    """Generate summary for a chapter"""
+def _summary_messages(text: str) -> list:
+    """Build the message pair for one chapter (shared by live and batch paths)."""
     # Use first 3000 chars for summary
     text_to_summarize = text[:3000]
 
@@ -29,70 +32,159 @@ Text:
 
 Summary (in Chinese):"""
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = client.chat.completions.create(
-                model=SUMMARY_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating concise, insightful chapter summaries."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=TEMPERATURE,
-                max_tokens=2000
-            )
+    return [
+        {"role": "system", "content": "You are an expert at creating concise, insightful chapter summaries."},
+        {"role": "user", "content": prompt}
+    ]
 
-            return response.choices[0].message.content.strip()
 
-        except Exception as e:
-            print(f"    Attempt {attempt + 1} failed: {e}")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(2 ** attempt)
+@llm_retry()
+async def _request_summary(client, messages: list) -> str:
+    """Dispatch one summary request; transient failures retry with backoff."""
+    response = await client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=2000
+    )
+    return response.choices[0].message.content.strip()
 
-    return ""
 
+async def generate_summary(client, chapter_num: int, text: str) -> str:
+    """Generate summary for a chapter"""
+    messages = _summary_messages(text)
 
-def summarize_chapters(input_dir: str, output_dir: str, max_chapters: int = None):
-    """Generate summaries for all chapters"""
+    cache_key = llm_cache.cache_key(SUMMARY_MODEL, messages, TEMPERATURE)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await _request_summary(client, messages)
+    except Exception as e:
+        print(f"    Chapter {chapter_num} failed: {e}")
+        return ""
+
+    llm_cache.put(cache_key, result)
+    return result
+
+
+async def _summarize_chapters_async(trans_files: list, output_dir: Path,
+                                    force: bool = False):
+    """Summarize chapters concurrently over one shared client.
+
+    Each chapter is a single request, so the semaphore directly caps
+    in-flight requests."""
+    client = get_async_openai_client()
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def run_chapter(trans_file: Path):
+        chapter_num = int(trans_file.stem.split('_')[1])
+
+        # Check if already summarized, before touching the input file
+        output_file = output_dir / f"chapter_{chapter_num:02d}_summary.txt"
+        if output_file.exists() and not force:
+            print(f"Chapter {chapter_num}: Already summarized, skipping")
+            return
+
+        # Read translation
+        text = trans_file.read_text(encoding='utf-8')
+
+        # Generate summary
+        async with semaphore:
+            summary = await generate_summary(client, chapter_num, text)
+
+        if summary:
+            output_file.write_text(summary, encoding='utf-8')
+            print(f"Chapter {chapter_num}: Done ({len(summary)} chars)")
+        else:
+            print(f"Chapter {chapter_num}: Failed")
+
+    try:
+        await asyncio.gather(*(run_chapter(f) for f in trans_files))
+    finally:
+        await client.close()
+
+
+def summarize_chapters_batch(input_dir: str, output_dir: str, max_chapters: int = None,
+                             force: bool = False):
+    """Summarize chapters through the Batch API.
+
+    One request per chapter, all submitted as a single batch job for
+    half-price tokens; cached chapters are served locally."""
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Initialize client
-    print("Initializing OpenAI client...")
-    client = get_openai_client()
-
-    # Get translation files
     trans_files = sorted(input_dir.glob('chapter_*_cn.md'))
     if max_chapters:
         trans_files = trans_files[:max_chapters]
 
-    print(f"Found {len(trans_files)} chapters to summarize\n")
+    print(f"Found {len(trans_files)} chapters to summarize (batch mode)\n")
+
+    results = {}   # custom_id -> summary
+    pending = {}   # custom_id -> cache key, for requests actually sent
+    entries = []   # (chapter_num, output_file, custom_id)
+    requests = []
 
-    # Generate summaries
     for trans_file in trans_files:
         chapter_num = int(trans_file.stem.split('_')[1])
 
-        # Check if already summarized
         output_file = output_dir / f"chapter_{chapter_num:02d}_summary.txt"
-        if output_file.exists():
+        if output_file.exists() and not force:
             print(f"Chapter {chapter_num}: Already summarized, skipping")
             continue
 
-        print(f"Chapter {chapter_num}...", end=' ', flush=True)
-
-        # Read translation
         text = trans_file.read_text(encoding='utf-8')
+        messages = _summary_messages(text)
+        custom_id = f"chapter-{chapter_num:02d}"
 
-        # Generate summary
-        summary = generate_summary(client, chapter_num, text)
-
+        cache_key = llm_cache.cache_key(SUMMARY_MODEL, messages, TEMPERATURE)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            results[custom_id] = cached
+        else:
+            pending[custom_id] = cache_key
+            requests.append((custom_id, {
+                'model': SUMMARY_MODEL,
+                'messages': messages,
+                'temperature': TEMPERATURE,
+                'max_tokens': 2000,
+            }))
+
+        entries.append((chapter_num, output_file, custom_id))
+
+    if requests:
+        client = get_openai_client()
+        batch_results = batch_api.run_batch(client, requests, 'chapter summaries')
+        for custom_id, summary in batch_results.items():
+            llm_cache.put(pending[custom_id], summary)
+            results[custom_id] = summary
+
+    for chapter_num, output_file, custom_id in entries:
+        summary = results.get(custom_id, '')
         if summary:
             output_file.write_text(summary, encoding='utf-8')
-            print(f"Done ({len(summary)} chars)")
+            print(f"Chapter {chapter_num}: Done ({len(summary)} chars)")
         else:
-            print("Failed")
+            print(f"Chapter {chapter_num}: Failed")
+
+
+def summarize_chapters(input_dir: str, output_dir: str, max_chapters: int = None,
+                       force: bool = False):
+    """Generate summaries for all chapters"""
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Get translation files
+    trans_files = sorted(input_dir.glob('chapter_*_cn.md'))
+    if max_chapters:
+        trans_files = trans_files[:max_chapters]
+
+    print(f"Found {len(trans_files)} chapters to summarize\n")
 
-        time.sleep(1)
+    asyncio.run(_summarize_chapters_async(trans_files, output_dir, force=force))
 
     print(f"\n{'='*60}")
     print(f"Summaries generated!")
@@ -105,10 +197,19 @@ def main():
     parser.add_argument('input_dir', help='Directory containing translated chapter files')
     parser.add_argument('output_dir', help='Directory to save summaries')
     parser.add_argument('--max', type=int, help='Summarize only first N chapters')
+    parser.add_argument('--batch', action='store_true',
+                        help='Use the Batch API (half-price tokens, up to 24h wait)')
+    parser.add_argument('--force', action='store_true',
+                        help='Resummarize chapters even if output already exists')
 
     args = parser.parse_args()
 
-    summarize_chapters(args.input_dir, args.output_dir, args.max)
+    if args.batch:
+        summarize_chapters_batch(args.input_dir, args.output_dir, args.max,
+                                 force=args.force)
+    else:
+        summarize_chapters(args.input_dir, args.output_dir, args.max,
+                           force=args.force)
 
 
 if __name__ == '__main__':
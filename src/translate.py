@@ -5,237 +5,423 @@ Preserves Markdown formatting from preprocessing step.
 """
 
 import argparse
-import time
+import asyncio
+import hashlib
+import json
 from pathlib import Path
 
+import aiofiles
+
 from config import (
-    get_openai_client, TRANSLATION_MODEL, TEMPERATURE, MAX_RETRIES, CHUNK_SIZE
+    get_openai_client, get_async_openai_client, llm_retry, TRANSLATION_MODEL,
+    TEMPERATURE, MAX_INPUT_TOKENS, LLM_CONCURRENCY,
 )
+import batch_api
+import llm_cache
+from chunking import split_into_chunks
 
 
-def _split_sentences(text: str) -> list:
-    """Split a paragraph into sentences using simple punctuation heuristics.
+# All static instructions live in the system message, byte-identical on
+# every request, so the API's prompt-prefix cache can reuse them; only
+# the part marker and the chunk itself vary per request
+_TRANSLATE_SYSTEM_PROMPT = """You are a professional literary translator specializing in English to Chinese translation, working on a book translation project.
 
-    Handles both English (.!?), and Chinese (。！？) sentence enders and consumes
-    following closing quotes/brackets. Keeps original order without rephrasing.
-    """
-    enders = set('.!?。！？')
-    closers = set('"\'\)\]”’』」»）]')
-    sentences = []
-    n = len(text)
-    start = 0
-    i = 0
-    while i < n:
-        c = text[i]
-        if c in enders:
-            j = i + 1
-            while j < n and text[j] in closers:
-                j += 1
-            if j >= n or text[j].isspace():
-                # cut here
-                seg = text[start:j]
-                if seg.strip():
-                    sentences.append(seg.strip())
-                # advance to next non-space
-                k = j
-                while k < n and text[k].isspace():
-                    k += 1
-                start = k
-                i = k
-                continue
-        i += 1
-    # trailing remainder
-    if start < n:
-        rem = text[start:]
-        if rem.strip():
-            sentences.append(rem.strip())
-    return sentences
+Task: Translate the given English text to Chinese (Simplified).
 
+Requirements:
+1. **Accuracy**: Stay faithful to the original meaning and tone
+2. **Fluency**: Use natural, idiomatic Chinese
+3. **Completeness**: Translate ALL text, do not summarize or skip content
+4. **Preserve Markdown formatting**: Keep all # ## * symbols exactly as they are
+5. Only translate the text content, do NOT translate or modify Markdown symbols"""
 
-def split_into_chunks(text: str) -> list:
-    """Split text into chunks with paragraph-first and sentence-aware boundaries.
 
-    - Greedily packs paragraphs (split by blank lines) up to CHUNK_SIZE.
-    - If a single paragraph exceeds CHUNK_SIZE, split it into sentences and pack.
-    - Falls back to space boundaries if a very long sentence exceeds CHUNK_SIZE.
-    """
-    paragraphs = text.split('\n\n')
-    chunks = []
-
-    current = []
-    current_len = 0
-
-    def flush_current():
-        nonlocal current, current_len
-        if current:
-            chunks.append('\n\n'.join(current).strip())
-            current = []
-            current_len = 0
-
-    for para in paragraphs:
-        if not para:
-            # preserve multiple blank blocks sparingly
-            sep = 2 if current else 0
-            if current_len + sep <= CHUNK_SIZE:
-                current.append('')
-                current_len += sep
-            else:
-                flush_current()
-            continue
+# Fused mode: PDF cleanup and translation in one request, so each chunk
+# is bought once instead of paying a preprocessing pass first
+_FUSED_SYSTEM_PROMPT = """You are a professional literary translator specializing in English to Chinese translation, working on a book translation project. The source text comes straight from PDF extraction and may contain artifacts.
 
-        # if this paragraph fits, add it
-        sep = 2 if current else 0
-        if current_len + sep + len(para) <= CHUNK_SIZE:
-            current.append(para)
-            current_len += sep + len(para)
-            continue
+Task: Clean the given English text, then translate it to Chinese (Simplified).
 
-        # if current has content, flush it first to keep boundaries clean
-        if current:
-            flush_current()
-
-        # paragraph is too large: split by sentences and pack
-        sentences = _split_sentences(para)
-        buf = []
-        buf_len = 0
-        for sent in sentences:
-            sep_in = 1 if buf else 0  # join sentences with a single space
-            if buf_len + sep_in + len(sent) <= CHUNK_SIZE:
-                buf.append(sent)
-                buf_len += sep_in + len(sent)
-            else:
-                if buf:
-                    chunks.append(' '.join(buf).strip())
-                    buf = [sent]
-                    buf_len = len(sent)
-                else:
-                    # ultra-long sentence: hard cut at last space before limit
-                    s = sent
-                    i = 0
-                    while i < len(s):
-                        end = min(i + CHUNK_SIZE, len(s))
-                        part = s[i:end]
-                        if end < len(s):
-                            cut = part.rfind(' ')
-                            if cut > CHUNK_SIZE * 0.6:
-                                part = part[:cut]
-                                end = i + cut
-                        chunks.append(part.strip())
-                        i = end
-                    buf = []
-                    buf_len = 0
-        if buf:
-            chunks.append(' '.join(buf).strip())
-
-    flush_current()
-    return [c for c in chunks if c]
-
-
-def translate_chunk(client, chunk: str, idx: int, total: int) -> str:
-    """Translate a single chunk"""
-    prompt = f"""You are a professional translator working on a book translation project.
-
-Task: Translate the following English text to Chinese (Simplified).
+Cleanup (apply silently before translating):
+1. Merge paragraphs split by page breaks and sentences incorrectly split across lines
+2. Fix hyphenated words split across lines (e.g., "meno-\\npause" → "menopause")
+3. Preserve intentional paragraph breaks
+4. Convert section headings to `## Heading`; do NOT add a chapter title H1
 
-Requirements:
+Translation requirements:
 1. **Accuracy**: Stay faithful to the original meaning and tone
 2. **Fluency**: Use natural, idiomatic Chinese
 3. **Completeness**: Translate ALL text, do not summarize or skip content
-4. **Preserve Markdown formatting**: Keep all # ## * symbols exactly as they are
-5. Only translate the text content, do NOT translate or modify Markdown symbols
+4. **Preserve Markdown formatting**: Keep # ## * symbols in the output
+5. Output ONLY the final Chinese translation"""
+
 
-Text to translate (Part {idx} of {total}):
+def _chunk_messages(chunk: str, idx: int, total: int, fused: bool = False) -> list:
+    """Build the message pair for one chunk (shared by live and batch paths)."""
+    prompt = f"""Text to translate (Part {idx} of {total}):
 
 {chunk}
 
 Chinese translation:"""
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = client.chat.completions.create(
-                model=TRANSLATION_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a professional literary translator specializing in English to Chinese translation."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=TEMPERATURE,
-                max_tokens=16000
-            )
-
-            return response.choices[0].message.content.strip()
-
-        except Exception as e:
-            print(f"      Attempt {attempt + 1} failed: {e}")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(2 ** attempt)
-            else:
-                return f"[Translation failed for chunk {idx}]"
-
-    return f"[Translation failed for chunk {idx}]"
+    return [
+        {"role": "system",
+         "content": _FUSED_SYSTEM_PROMPT if fused else _TRANSLATE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
 
-def translate_chapter(client, chapter_num: int, text: str) -> str:
-    """Translate a chapter by splitting into chunks"""
-    print(f"  Translating Chapter {chapter_num}...")
-
-    chunks = split_into_chunks(text)
-    print(f"    Split into {len(chunks)} chunks")
+def _failure_placeholder(idx: int) -> str:
+    """Marker written in place of a chunk whose translation failed."""
+    return f"[Translation failed for chunk {idx}]"
 
-    translations = []
-    for idx, chunk in enumerate(chunks, 1):
-        print(f"    Chunk {idx}/{len(chunks)}...", end=' ', flush=True)
-        translation = translate_chunk(client, chunk, idx, len(chunks))
-        translations.append(translation)
-        print(f"Done ({len(translation):,} chars)")
-        time.sleep(1)
 
-    full_translation = "\n\n".join(translations)
-    print(f"    Total: {len(full_translation):,} chars")
+@llm_retry()
+async def _request_translation(client, messages: list) -> str:
+    """Dispatch one translation request, streaming the tokens back.
+
+    Streaming keeps the connection active for the whole generation
+    instead of holding a request open against the read timeout waiting
+    for one big body. Transient failures are retried by the decorator."""
+    stream = await client.chat.completions.create(
+        model=TRANSLATION_MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=16000,
+        stream=True
+    )
+    parts = []
+    async for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            parts.append(event.choices[0].delta.content)
+
+    return ''.join(parts).strip()
+
+
+async def translate_chunk(client, chunk: str, idx: int, total: int,
+                          fused: bool = False) -> str:
+    """Translate a single chunk (optionally fusing PDF cleanup into it)"""
+    messages = _chunk_messages(chunk, idx, total, fused)
+
+    cache_key = llm_cache.cache_key(TRANSLATION_MODEL, messages, TEMPERATURE)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Optional: serve near-identical chunks (opt-in, see llm_cache).
+    # Scoped per mode: fused responses must not answer plain requests
+    scope = 'fused' if fused else 'translate'
+    cached = llm_cache.semantic_get(chunk, scope=scope)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await _request_translation(client, messages)
+    except Exception as e:
+        print(f"      Chunk {idx} failed: {e}")
+        return _failure_placeholder(idx)
+
+    llm_cache.put(cache_key, result)
+    llm_cache.semantic_put(chunk, result, scope=scope)
+    return result
+
+
+async def translate_and_clean_chunk(client, chunk: str, idx: int, total: int) -> str:
+    """Clean PDF artifacts and translate in a single request."""
+    return await translate_chunk(client, chunk, idx, total, fused=True)
+
+
+def _save_chunk_plan(plan_file: Path, digest: str, chunks: list, done: dict):
+    """Write the resume sidecar atomically (write-then-rename).
+
+    Failure placeholders are never recorded: resume must re-request a
+    failed chunk, not replay the marker as a finished translation."""
+    tmp = plan_file.with_name(plan_file.name + '.tmp')
+    tmp.write_text(json.dumps({
+        'sha256': digest,
+        'chunks': chunks,
+        'done': {str(idx): text for idx, text in done.items()
+                 if text != _failure_placeholder(idx)},
+    }, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(plan_file)
+
+
+def _load_chunk_plan(output_dir: Path, chapter_num: int, content: str,
+                     fused: bool = False) -> tuple:
+    """Load or create the chapter's chunk plan for partial resume.
+
+    The sidecar under output_dir/.chunks records the chunk boundaries,
+    a digest of the source content and prompt mode they were computed
+    for, and the translations finished so far. A rerun whose source and
+    mode still match the recorded digest resumes at the missing chunks
+    instead of starting the chapter over; a changed source — or the same
+    source under the other mode, whose checkpointed translations answer
+    a different prompt — invalidates the plan.
+
+    Returns (plan_file, digest, chunks, done).
+    """
+    plan_dir = output_dir / '.chunks'
+    plan_file = plan_dir / f"{chapter_num:02d}.json"
+    hasher = hashlib.sha256(content.encode('utf-8'))
+    hasher.update(b'fused' if fused else b'plain')
+    digest = hasher.hexdigest()
 
-    return full_translation
+    if plan_file.exists():
+        try:
+            plan = json.loads(plan_file.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError):
+            plan = None
+        if plan and plan.get('sha256') == digest:
+            # Drop any failure placeholders a past run may have recorded,
+            # so resume re-requests those chunks instead of keeping them
+            done = {int(idx): text for idx, text in plan.get('done', {}).items()
+                    if text != _failure_placeholder(int(idx))}
+            return plan_file, digest, plan['chunks'], done
+
+    plan_dir.mkdir(parents=True, exist_ok=True)
+    chunks = split_into_chunks(content, MAX_INPUT_TOKENS)
+    _save_chunk_plan(plan_file, digest, chunks, {})
+    return plan_file, digest, chunks, {}
+
+
+async def translate_chapter(client, semaphore, chapter_num: int, text: str,
+                            outfile, fused: bool = False, plan: tuple = None) -> int:
+    """Translate a chapter by splitting into chunks.
+
+    Chunks are independent requests, so they run concurrently under the
+    shared semaphore. Each translation is written to outfile (an async
+    aiofiles handle) as soon as the contiguous prefix before it is
+    complete, so the chapter never sits fully in memory and finished
+    work is on disk if the run dies.
+    When a plan tuple from _load_chunk_plan is given, chunks recorded as
+    done are served from the sidecar and each new result is checkpointed
+    to it, so an interrupted chapter resumes at the missing chunks.
+    Returns the number of characters written."""
+    print(f"  Translating Chapter {chapter_num}...")
 
+    if plan is not None:
+        plan_file, digest, chunks, done = plan
+    else:
+        plan_file = digest = None
+        chunks = split_into_chunks(text, MAX_INPUT_TOKENS)
+        done = {}
+
+    pending_idx = [idx for idx in range(1, len(chunks) + 1) if idx not in done]
+    print(f"    Split into {len(chunks)} chunks"
+          + (f" ({len(done)} resumed from earlier run)" if done else ""))
+
+    async def run_chunk(idx: int) -> tuple:
+        async with semaphore:
+            translation = await translate_chunk(client, chunks[idx - 1], idx,
+                                                len(chunks), fused=fused)
+        print(f"    Chapter {chapter_num} chunk {idx}/{len(chunks)} done "
+              f"({len(translation):,} chars)")
+        return idx, translation
+
+    next_to_write = 1
+    total_chars = 0
+
+    async def flush_prefix():
+        nonlocal next_to_write, total_chars
+        while next_to_write in done:
+            if next_to_write > 1:
+                await outfile.write("\n\n")
+                total_chars += 2
+            await outfile.write(done[next_to_write])
+            total_chars += len(done[next_to_write])
+            next_to_write += 1
+
+    # Flush whatever contiguous prefix the resumed plan already covers
+    await flush_prefix()
+
+    for future in asyncio.as_completed([run_chunk(idx) for idx in pending_idx]):
+        idx, translation = await future
+        done[idx] = translation
+        # Checkpoint real translations only: a failure placeholder must
+        # not survive into the sidecar, or resume would treat the chunk
+        # as finished and bake the marker into the chapter forever
+        if plan_file is not None and translation != _failure_placeholder(idx):
+            _save_chunk_plan(plan_file, digest, chunks, done)
+        await flush_prefix()
+
+    print(f"    Total: {total_chars:,} chars")
+    return total_chars
+
+
+async def _translate_chapters_async(chapter_files: list, output_dir: Path,
+                                    fused: bool = False, force: bool = False):
+    """Translate chapters through a reader/translator pipeline.
+
+    A reader task pre-reads and pre-splits upcoming chapters into a
+    bounded queue while earlier ones are still translating, so disk I/O
+    overlaps LLM latency and only a few chapters sit in memory at once
+    (instead of every chapter being read up front). Translator workers
+    pull chapters off the queue; the semaphore still bounds in-flight
+    chunk requests across the whole run. File reads and writes go
+    through aiofiles, keeping the event loop free for the API streams."""
+    client = get_async_openai_client()
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    # Read ahead at most this many chapters beyond those translating
+    queue = asyncio.Queue(maxsize=3)
+
+    async def reader():
+        for chapter_file in chapter_files:
+            chapter_num = int(chapter_file.stem.split('_')[1])
+
+            # Check if already translated, before touching the input file
+            output_file = output_dir / f"chapter_{chapter_num:02d}_cn.md"
+            if output_file.exists() and not force:
+                print(f"Chapter {chapter_num}: Already translated, skipping")
+                continue
 
-def translate_chapters(input_dir: str, output_dir: str, max_chapters: int = None):
-    """Translate all chapters in input directory"""
+            # Read chapter: title off the first line, content in one read
+            async with aiofiles.open(chapter_file, 'r', encoding='utf-8') as f:
+                title = (await f.readline()).rstrip('\n') or f"Chapter {chapter_num}"
+                content = await f.read()
+
+            plan = _load_chunk_plan(output_dir, chapter_num, content,
+                                    fused=fused)
+            await queue.put((chapter_num, title, content, output_file, plan))
+
+        # One stop signal per translator worker
+        for _ in range(LLM_CONCURRENCY):
+            await queue.put(None)
+
+    async def translator():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chapter_num, title, content, output_file, plan = item
+
+            print(f"\nChapter {chapter_num}: {title}")
+
+            # Translate, streaming completed chunks straight to disk;
+            # write under a temporary name so the exists-check above
+            # never takes a half-written chapter for a finished one
+            part_file = output_file.with_name(output_file.name + '.part')
+            async with aiofiles.open(part_file, 'w', encoding='utf-8') as outfile:
+                await outfile.write(f"{title}\n\n")
+                await translate_chapter(client, semaphore, chapter_num, content,
+                                        outfile, fused=fused, plan=plan)
+            part_file.replace(output_file)
+            # Chapter is complete; the resume sidecar has served its purpose
+            plan[0].unlink(missing_ok=True)
+            print(f"    Saved: {output_file.name}")
+
+    try:
+        await asyncio.gather(reader(),
+                             *(translator() for _ in range(LLM_CONCURRENCY)))
+    finally:
+        await client.close()
+
+
+def translate_chapters_batch(input_dir: str, output_dir: str, max_chapters: int = None,
+                             force: bool = False, fused: bool = False):
+    """Translate chapters through the Batch API.
+
+    All chunks of all pending chapters go into one batch job; tokens cost
+    half the live rate, at the price of waiting (up to 24 h) for the
+    batch to finish. Cached chunks are served locally and never submitted.
+    With fused=True each request cleans PDF artifacts and translates in
+    one pass, same as the live path.
+    """
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Initialize client
-    print("Initializing OpenAI client...")
-    client = get_openai_client()
-
-    # Get chapter files
     chapter_files = sorted(input_dir.glob('chapter_*.txt'))
     if max_chapters:
         chapter_files = chapter_files[:max_chapters]
 
-    print(f"Found {len(chapter_files)} chapters to translate\n")
+    print(f"Found {len(chapter_files)} chapters to translate (batch mode)\n")
+
+    results = {}   # custom_id -> translation
+    pending = {}   # custom_id -> cache key, for requests actually sent
+    chapters = []  # (chapter_num, title, output_file, ordered custom_ids)
+    requests = []
 
-    # Translate each chapter
     for chapter_file in chapter_files:
         chapter_num = int(chapter_file.stem.split('_')[1])
 
-        # Check if already translated
         output_file = output_dir / f"chapter_{chapter_num:02d}_cn.md"
-        if output_file.exists():
+        if output_file.exists() and not force:
             print(f"Chapter {chapter_num}: Already translated, skipping")
             continue
 
-        # Read chapter
-        text = chapter_file.read_text(encoding='utf-8')
-        lines = text.split('\n', 1)
-        title = lines[0] if lines else f"Chapter {chapter_num}"
-        content = lines[1] if len(lines) > 1 else text
+        with open(chapter_file, 'r', encoding='utf-8') as f:
+            title = f.readline().rstrip('\n') or f"Chapter {chapter_num}"
+            content = f.read()
+
+        chunks = split_into_chunks(content, MAX_INPUT_TOKENS)
+        custom_ids = []
+        for idx, chunk in enumerate(chunks, 1):
+            custom_id = f"chapter-{chapter_num:02d}-chunk-{idx:03d}"
+            custom_ids.append(custom_id)
+
+            messages = _chunk_messages(chunk, idx, len(chunks), fused=fused)
+            cache_key = llm_cache.cache_key(TRANSLATION_MODEL, messages, TEMPERATURE)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                results[custom_id] = cached
+                continue
+
+            pending[custom_id] = cache_key
+            requests.append((custom_id, {
+                'model': TRANSLATION_MODEL,
+                'messages': messages,
+                'temperature': TEMPERATURE,
+                'max_tokens': 16000,
+            }))
+
+        chapters.append((chapter_num, title, output_file, custom_ids))
+        print(f"Chapter {chapter_num}: {title} ({len(chunks)} chunks)")
+
+    if requests:
+        client = get_openai_client()
+        batch_results = batch_api.run_batch(client, requests, 'book translation')
+        for custom_id, translation in batch_results.items():
+            llm_cache.put(pending[custom_id], translation)
+            results[custom_id] = translation
+
+    # Reassemble chapters from per-chunk results, in chunk order. A
+    # chapter with any missing chunk (failed or expired batch) is not
+    # written, so the next run retries it instead of skipping a chapter
+    # full of failure markers as "already translated".
+    for chapter_num, title, output_file, custom_ids in chapters:
+        missing = [custom_id for custom_id in custom_ids
+                   if custom_id not in results]
+        if missing:
+            print(f"Chapter {chapter_num}: {len(missing)}/{len(custom_ids)} "
+                  f"chunks missing, not saving {output_file.name}")
+            continue
+        full_translation = "\n\n".join(results[custom_id]
+                                       for custom_id in custom_ids)
+        output_file.write_text(f"{title}\n\n{full_translation}", encoding='utf-8')
+        print(f"Chapter {chapter_num}: Saved {output_file.name} "
+              f"({len(full_translation):,} chars)")
+
 
-        print(f"\nChapter {chapter_num}: {title}")
+def translate_chapters(input_dir: str, output_dir: str, max_chapters: int = None,
+                       fused: bool = False, force: bool = False):
+    """Translate all chapters in input directory.
 
-        # Translate
-        translation = translate_chapter(client, chapter_num, content)
+    With fused=True the input is raw extracted chapters and each request
+    cleans PDF artifacts and translates in one pass, skipping the
+    preprocessing stage entirely."""
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Get chapter files
+    chapter_files = sorted(input_dir.glob('chapter_*.txt'))
+    if max_chapters:
+        chapter_files = chapter_files[:max_chapters]
+
+    print(f"Found {len(chapter_files)} chapters to translate\n")
 
-        # Save translation
-        output_file.write_text(f"{title}\n\n{translation}", encoding='utf-8')
-        print(f"    Saved: {output_file.name}")
+    asyncio.run(_translate_chapters_async(chapter_files, output_dir, fused=fused,
+                                          force=force))
 
     print(f"\n{'='*60}")
     print(f"All chapters translated!")
@@ -248,10 +434,22 @@ def main():
     parser.add_argument('input_dir', help='Directory containing preprocessed chapter files')
     parser.add_argument('output_dir', help='Directory to save translations')
     parser.add_argument('--max', type=int, help='Translate only first N chapters')
+    parser.add_argument('--batch', action='store_true',
+                        help='Use the Batch API (half-price tokens, up to 24h wait)')
+    parser.add_argument('--fused', action='store_true',
+                        help='Translate raw extracted chapters directly, '
+                             'fusing PDF cleanup into each translation request')
+    parser.add_argument('--force', action='store_true',
+                        help='Retranslate chapters even if output already exists')
 
     args = parser.parse_args()
 
-    translate_chapters(args.input_dir, args.output_dir, args.max)
+    if args.batch:
+        translate_chapters_batch(args.input_dir, args.output_dir, args.max,
+                                 force=args.force, fused=args.fused)
+    else:
+        translate_chapters(args.input_dir, args.output_dir, args.max,
+                           fused=args.fused, force=args.force)
 
 
 if __name__ == '__main__':
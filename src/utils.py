@@ -3,39 +3,67 @@
 Shared utility functions for chapter extraction.
 """
 
+import functools
 import re
 
+# Directories already created by this process; repeated ensure calls
+# become a set lookup instead of a mkdir/stat syscall
+_DIRS_CREATED = set()
 
+# Title separators (ASCII and fullwidth colon), compiled once for the
+# per-page title extraction
+_COLON_RE = re.compile(r'[:：]')
+
+# Chinese numeral values, built once instead of per chinese_to_int call
+_CHINESE_NUMS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
+                 '六': 6, '七': 7, '八': 8, '九': 9, '十': 10,
+                 '百': 100, '零': 0}
+
+# Canonical numerals up to 999 (optional digit-prefixed 百, optional 零,
+# optional digit-prefixed 十, optional unit digit), decomposed in one
+# match instead of repeated split/scan passes
+_CN_NUM_RE = re.compile(
+    r'^(?:(?P<hund>[一二三四五六七八九]?)百)?零?'
+    r'(?:(?P<tens>[一二三四五六七八九]?)十)?'
+    r'(?P<unit>[一二三四五六七八九]?)$'
+)
+
+
+def ensure_dir(path):
+    """Create a directory (with parents) at most once per process."""
+    if path not in _DIRS_CREATED:
+        path.mkdir(parents=True, exist_ok=True)
+        _DIRS_CREATED.add(path)
+
+
+@functools.lru_cache(maxsize=256)
 def chinese_to_int(s: str) -> int:
-    """Convert Chinese numeral string to integer."""
+    """Convert Chinese numeral string to integer.
+
+    Memoized: chapter scans feed in the same short numeral strings
+    ("一", "二", ...) over and over.
+    """
     if s.isdigit():
         return int(s)
 
-    chinese_nums = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
-                    '六': 6, '七': 7, '八': 8, '九': 9, '十': 10,
-                    '百': 100, '零': 0}
-
     if len(s) == 1:
-        return chinese_nums.get(s, 0)
-
-    # Handle numbers like 十一, 二十, 二十一
-    result = 0
-    if '百' in s:
-        parts = s.split('百')
-        result = chinese_nums.get(parts[0], 1) * 100
-        s = parts[1] if len(parts) > 1 else ''
+        return _CHINESE_NUMS.get(s, 0)
 
-    if '十' in s:
-        parts = s.split('十')
-        tens = chinese_nums.get(parts[0], 1) if parts[0] else 1
-        result += tens * 10
-        if len(parts) > 1 and parts[1]:
-            result += chinese_nums.get(parts[1], 0)
-    elif s:
-        for c in s:
-            result += chinese_nums.get(c, 0)
+    # Handle numbers like 十一, 二十, 二十一 with a single match
+    match = _CN_NUM_RE.match(s)
+    if match:
+        hund, tens, unit = match.group('hund', 'tens', 'unit')
+        result = 0
+        if hund is not None:
+            result += (_CHINESE_NUMS[hund] if hund else 1) * 100
+        if tens is not None:
+            result += (_CHINESE_NUMS[tens] if tens else 1) * 10
+        if unit:
+            result += _CHINESE_NUMS[unit]
+        return result
 
-    return result
+    # Non-canonical string: fall back to summing known digit values
+    return sum(_CHINESE_NUMS.get(c, 0) for c in s)
 
 
 def extract_title_from_lines(lines: list, chapter_line: str) -> str:
@@ -52,7 +80,7 @@ def extract_title_from_lines(lines: list, chapter_line: str) -> str:
             found_chapter = True
             # If chapter line contains title (e.g., "Chapter 1: Introduction")
             if ':' in line or '：' in line:
-                title = re.split(r'[:：]', line, 1)[1].strip()
+                title = _COLON_RE.split(line, 1)[1].strip()
                 if title:
                     return title
             continue
@@ -78,6 +106,42 @@ def clean_html_text(html_content: str) -> str:
     Returns:
         Cleaned plain text
     """
+    # Short inputs (titles, TOC entries) repeat heavily across a book;
+    # serve those from a cache and only parse long bodies every time
+    if len(html_content) < 256:
+        return _clean_small(html_content)
+    return _clean_html_text(html_content)
+
+
+@functools.lru_cache(maxsize=1024)
+def _clean_small(html_content: str) -> str:
+    """Cached fast path of clean_html_text for short, repetitive inputs."""
+    return _clean_html_text(html_content)
+
+
+def _clean_html_text(html_content: str) -> str:
+    text = _html_to_text(html_content)
+
+    # Clean up whitespace
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+
+    return text
+
+
+def _html_to_text_selectolax(html_content: str) -> str:
+    """Extract text via selectolax (C-backed lexbor, ~30x html.parser)."""
+    from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(html_content)
+    for node in tree.css('script, style'):
+        node.decompose()
+    return tree.text(separator='\n')
+
+
+def _html_to_text_bs4(html_content: str) -> str:
+    """Extract text via BeautifulSoup (pure-Python fallback)."""
     from bs4 import BeautifulSoup
 
     soup = BeautifulSoup(html_content, 'html.parser')
@@ -86,10 +150,13 @@ def clean_html_text(html_content: str) -> str:
     for script in soup(['script', 'style']):
         script.decompose()
 
-    # Get text and clean up whitespace
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = '\n'.join(chunk for chunk in chunks if chunk)
+    return soup.get_text()
 
-    return text
+
+# Prefer the C parser when it is installed; BeautifulSoup remains the
+# fallback so selectolax stays an optional dependency
+try:
+    import selectolax  # noqa: F401
+    _html_to_text = _html_to_text_selectolax
+except ImportError:
+    _html_to_text = _html_to_text_bs4